@@ -1,23 +1,41 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import filters, FilterSet
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.cache import get_tag_ids_by_slug, get_tags
+from recipes.models import Recipe, RecipeTag
+from recipes.search import search_recipes
 
 
-class IngredientListFilter(FilterSet):
+DEFAULT_RECIPE_ORDERING = ('-created', '-id')
+SEARCH_RECIPE_ORDERING = ('-rank', '-id')
+RECIPE_ORDERINGS = {
+    'popular': ('-favorites_count', '-created', '-id'),
+}
+
+
+def get_recipe_ordering(request):
     """
-    Фильтр для ингредиентов.
+    Порядок рецептов по параметру запроса ordering.
 
-    Ищет по начальному вхождению в поле name.
+    Без него результаты поиска идут по убыванию релевантности,
+    остальные списки - по дате добавления.
     """
 
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith'
-    )
+    ordering = request.query_params.get('ordering')
 
-    class Meta:
-        model = Ingredient
-        fields = ['name']
+    if ordering in RECIPE_ORDERINGS:
+        return RECIPE_ORDERINGS[ordering]
+    if request.query_params.get('search', '').strip():
+        return SEARCH_RECIPE_ORDERING
+    return DEFAULT_RECIPE_ORDERING
+
+
+def tag_slug_choices():
+    """
+    Варианты слагов тегов для фильтра, берутся из кэша тегов.
+    """
+
+    return [(tag.slug, tag.name) for tag in get_tags().values()]
 
 
 class RecipeListFilter(FilterSet):
@@ -25,13 +43,14 @@ class RecipeListFilter(FilterSet):
     Фильтр для рецептов.
 
     Ищет по slug модели Tag, а также по вхождению или
-    невхождению в список покупок и список избранного
+    невхождению в список покупок и список избранного.
+    Параметр ordering=popular сортирует по числу добавлений в избранное,
+    search ищет по названию, ингредиентам и описанию.
     """
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_slug_choices,
+        method='tags_filter'
     )
 
     is_favorited = filters.BooleanFilter(
@@ -40,6 +59,11 @@ class RecipeListFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
+    search = filters.CharFilter(method='search_filter')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='ordering_filter'
+    )
 
     class Meta:
         model = Recipe
@@ -48,6 +72,40 @@ class RecipeListFilter(FilterSet):
             'author',
         )
 
+    def tags_filter(self, queryset, name, value):
+        """
+        Метод формирующий фильтр по тегам.
+
+        Рецепт подходит, если у него есть хотя бы один из тегов.
+        Условие строится через EXISTS, поэтому рецепты не дублируются
+        и DISTINCT не нужен. Слаги переводятся в id без запроса к БД.
+        """
+
+        slugs = get_tag_ids_by_slug()
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[slugs[slug] for slug in value if slug in slugs]
+        )))
+
+    def search_filter(self, queryset, name, value):
+        """
+        Метод формирующий полнотекстовый поиск.
+
+        Рецепты получают оценку rank, по ней они сортируются,
+        если не задан параметр ordering.
+        """
+
+        return search_recipes(queryset, value).order_by(
+            *get_recipe_ordering(self.request)
+        )
+
+    def ordering_filter(self, queryset, name, value):
+        """
+        Метод задающий сортировку рецептов.
+        """
+
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
     def is_favorited_filter(self, queryset, name, value):
         """
         Метод формирующий фильтр по вхождению в избранное.
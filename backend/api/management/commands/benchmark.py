@@ -0,0 +1,416 @@
+import base64
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.synthetic import SyntheticData
+from recipes.tasks import get_task_backend
+from users.models import User
+
+
+DEFAULT_USERS = 1000
+DEFAULT_RECIPES = 20000
+DEFAULT_REPEAT = 50
+DEFAULT_THRESHOLD = 20
+PERCENTILES = (50, 90, 99)
+
+
+def make_image():
+    """
+    Картинка рецепта в формате data URI.
+    """
+
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def summarize(timings, queries):
+    """
+    Перцентили времени ответа в мс и количество SQL-запросов.
+    """
+
+    cuts = statistics.quantiles(timings, n=100) if len(timings) > 1 else (
+        timings * 99
+    )
+    return {
+        'requests': len(timings),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        **{
+            f'p{percentile}_ms': round(cuts[percentile - 1], 3)
+            for percentile in PERCENTILES
+        },
+        'queries_median': statistics.median(queries),
+        'queries_max': max(queries),
+    }
+
+
+class Benchmark:
+    """
+    Сценарии нагрузки на основные эндпоинты API.
+
+    Каждый сценарий - метод scenario_<имя>, который возвращает
+    функцию одного запроса и ожидаемый код ответа.
+    """
+
+    def __init__(self, user, anonymous_client, client):
+        self.user = user
+        self.anonymous = anonymous_client
+        self.client = client
+        self.recipe = Recipe.objects.filter(author=user).first() or (
+            Recipe.objects.first()
+        )
+        self.tags = list(Tag.objects.values_list('id', 'slug'))
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', 'name')[:20]
+        )
+        self.image = make_image()
+        self.created = []
+        self.run_id = uuid4().hex
+
+    def scenarios(self):
+        return {
+            name[len('scenario_'):]: getattr(self, name)
+            for name in dir(self) if name.startswith('scenario_')
+        }
+
+    def recipe_payload(self, shift=0):
+        ingredients = self.ingredients[shift % 5:shift % 5 + 5]
+        return {
+            'name': f'Рецепт для замера {shift}',
+            'text': 'Рецепт, созданный командой benchmark.',
+            'cooking_time': 10 + shift % 50,
+            'image': self.image,
+            'tags': [tag_id for tag_id, _ in self.tags[:1 + shift % 2]],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10 + shift}
+                for ingredient_id, _ in ingredients
+            ],
+        }
+
+    def scenario_recipe_list(self):
+        return lambda _: self.client.get('/api/recipes/?limit=6'), 200
+
+    def scenario_recipe_list_anonymous(self):
+        # Уникальный параметр дает новый ключ кэша ответов, иначе
+        # замерялось бы только чтение AnonymousListCacheMixin.
+        return (
+            lambda number: self.anonymous.get(
+                f'/api/recipes/?limit=6&run={self.run_id}-{number}'
+            ),
+            200
+        )
+
+    def scenario_recipe_list_anonymous_cached(self):
+        return lambda _: self.anonymous.get('/api/recipes/?limit=6'), 200
+
+    def scenario_recipe_list_tags(self):
+        query = '&'.join(f'tags={slug}' for _, slug in self.tags[:2])
+        return (
+            lambda _: self.client.get(f'/api/recipes/?limit=6&{query}'),
+            200
+        )
+
+    def scenario_recipe_list_favorited(self):
+        return (
+            lambda _: self.client.get(
+                '/api/recipes/?limit=6&is_favorited=1'
+            ),
+            200
+        )
+
+    def scenario_recipe_detail(self):
+        return (
+            lambda _: self.client.get(f'/api/recipes/{self.recipe.id}/'),
+            200
+        )
+
+    def scenario_subscriptions(self):
+        return (
+            lambda _: self.client.get(
+                '/api/users/subscriptions/?limit=6&recipes_limit=3'
+            ),
+            200
+        )
+
+    def scenario_download_shopping_cart(self):
+        def request(_):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/'
+            )
+            b''.join(response.streaming_content)
+            return response
+
+        return request, 200
+
+    def scenario_ingredient_search(self):
+        prefixes = [name[:2] for _, name in self.ingredients] or ['а']
+        return (
+            lambda number: self.client.get(
+                f'/api/ingredients/?name={prefixes[number % len(prefixes)]}'
+            ),
+            200
+        )
+
+    def scenario_recipe_create(self):
+        def request(number):
+            response = self.client.post(
+                '/api/recipes/',
+                self.recipe_payload(number),
+                format='json'
+            )
+            if response.status_code == 201:
+                self.created.append(response.data['id'])
+            return response
+
+        return request, 201
+
+    def scenario_recipe_update(self):
+        # Изменяется рецепт, созданный для замера, чтобы не портить
+        # данные, на которых замеряются остальные сценарии.
+        response = self.client.post(
+            '/api/recipes/',
+            self.recipe_payload(),
+            format='json'
+        )
+        if response.status_code != 201:
+            raise CommandError(
+                f'recipe_update: не удалось создать рецепт, '
+                f'получен ответ {response.status_code}'
+            )
+        recipe_id = response.data['id']
+        self.created.append(recipe_id)
+
+        def request(number):
+            return self.client.patch(
+                f'/api/recipes/{recipe_id}/',
+                self.recipe_payload(number),
+                format='json'
+            )
+
+        return request, 200
+
+    def cleanup(self):
+        """
+        Удаляет созданные рецепты и дожидается фоновых задач
+        (варианты картинок), пока временный MEDIA_ROOT еще существует.
+        """
+
+        backend = get_task_backend()
+        backend.drain()
+        Recipe.objects.filter(id__in=self.created).delete()
+        backend.drain()
+
+
+class Command(BaseCommand):
+    """
+    Замер основных эндпоинтов API на синтетических данных.
+
+    Для каждого сценария выполняется --repeat запросов через
+    тестовый клиент, в отчет попадают перцентили времени ответа
+    и количество SQL-запросов. Отчет сохраняется в JSON, с помощью
+    --compare его можно сравнить с отчетом другого коммита.
+    Данные создаются в текущей базе, поэтому запускать команду
+    нужно на отдельной базе. Картинки рецептов, созданных во время
+    замера, сохраняются во временный каталог. Фоновые задачи
+    выполняются в процессе команды, поэтому обработчик run_tasks
+    на этой базе во время замера запускать не нужно.
+    """
+
+    help = 'Замер времени ответа и числа запросов основных эндпоинтов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+        parser.add_argument('--recipes', type=int, default=DEFAULT_RECIPES)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--no-seed',
+            action='store_true',
+            help='Не создавать данные, использовать уже имеющиеся'
+        )
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+        parser.add_argument(
+            '--scenarios',
+            nargs='+',
+            help='Запустить только эти сценарии'
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark.json',
+            help='Файл для отчета'
+        )
+        parser.add_argument(
+            '--compare',
+            help='Отчет, с которым сравнить результаты'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=DEFAULT_THRESHOLD,
+            help='Допустимый рост p50 в процентах при сравнении'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше 0')
+
+        if not options['no_seed']:
+            SyntheticData(
+                users=options['users'],
+                recipes=options['recipes'],
+                seed=options['seed'],
+                log=self.stdout.write
+            ).generate()
+
+        user = User.objects.filter(
+            follower__isnull=False,
+            shopping_list__isnull=False,
+            recipes__isnull=False
+        ).first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователя с подписками, рецептами и списком '
+                'покупок, запустите без --no-seed'
+            )
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(
+                ALLOWED_HOSTS=['testserver'],
+                MEDIA_ROOT=media_root
+            ):
+                results = self.run_scenarios(user, options)
+
+        report = {
+            'meta': self.get_meta(options),
+            'results': results,
+        }
+        Path(options['output']).write_text(
+            json.dumps(report, ensure_ascii=False, indent=2),
+            encoding='utf-8'
+        )
+        self.stdout.write(f'Отчет сохранен в {options["output"]}')
+
+        if options['compare']:
+            self.compare(options['compare'], results, options['threshold'])
+
+    def run_scenarios(self, user, options):
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        benchmark = Benchmark(user, APIClient(), client)
+        scenarios = benchmark.scenarios()
+
+        unknown = set(options['scenarios'] or ()) - set(scenarios)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {sorted(unknown)}')
+
+        results = {}
+        try:
+            for name in options['scenarios'] or sorted(scenarios):
+                request, expected_status = scenarios[name]()
+                results[name] = self.measure(
+                    name, request, expected_status, options['repeat']
+                )
+        finally:
+            benchmark.cleanup()
+
+        return results
+
+    def measure(self, name, request, expected_status, repeat):
+        timings = []
+        queries = []
+
+        for number in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = request(number)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != expected_status:
+                raise CommandError(
+                    f'{name}: ожидался ответ {expected_status}, '
+                    f'получен {response.status_code}'
+                )
+            queries.append(len(context.captured_queries))
+
+        result = summarize(timings, queries)
+        self.stdout.write(
+            f'{name}: p50 {result["p50_ms"]} мс, '
+            f'p99 {result["p99_ms"]} мс, '
+            f'запросов {result["queries_median"]}'
+        )
+        return result
+
+    @staticmethod
+    def get_meta(options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'],
+                capture_output=True,
+                text=True,
+                cwd=settings.BASE_DIR,
+                check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {
+            'commit': commit,
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'repeat': options['repeat'],
+        }
+
+    def compare(self, path, results, threshold):
+        """
+        Сравнивает результаты с прошлым отчетом.
+
+        Если p50 вырос больше чем на threshold процентов или медиана
+        числа SQL-запросов выросла хотя бы на один запрос, команда
+        завершается с ошибкой.
+        """
+
+        try:
+            baseline = json.loads(Path(path).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+
+        regressions = []
+
+        for name, result in results.items():
+            previous = baseline['results'].get(name)
+            if previous is None:
+                continue
+            change = (
+                (result['p50_ms'] - previous['p50_ms'])
+                / previous['p50_ms'] * 100
+                if previous['p50_ms'] else 0
+            )
+            queries = result['queries_median'] - previous['queries_median']
+            self.stdout.write(
+                f'{name}: p50 {previous["p50_ms"]} -> {result["p50_ms"]} мс '
+                f'({change:+.1f}%), запросов {previous["queries_median"]} '
+                f'-> {result["queries_median"]}'
+            )
+            if change > threshold or queries >= 1:
+                regressions.append(name)
+
+        if regressions:
+            raise CommandError(f'Регрессия в сценариях: {regressions}')
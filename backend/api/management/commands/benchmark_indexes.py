@@ -0,0 +1,170 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from recipes.models import (
+    Favorite,
+    IngredientInRecipe,
+    Recipe,
+    RecipeTag,
+    Tag
+)
+from recipes.synthetic import SyntheticData
+from users.models import User
+
+
+PAGE_SIZE = 6
+DEFAULT_RECIPES = 1_000_000
+DEFAULT_USERS = 10_000
+DEFAULT_REPEAT = 5
+DEEP_PAGE_SHARE = 0.9
+
+
+def hot_queries():
+    """
+    Запросы, на которые рассчитаны индексы recipes.models.
+
+    Параметры (автор, тег, пользователь, позиция глубокой страницы)
+    выбираются из текущих данных один раз, чтобы замеры до и после
+    сравнивали одинаковые запросы.
+    """
+
+    feed = Recipe.objects.order_by('-created', '-id')
+    total = feed.count()
+    if not total:
+        raise CommandError('В базе нет рецептов, запустите без --no-seed')
+
+    deep = feed.values('created', 'id')[int(total * DEEP_PAGE_SHARE)]
+    author_id = feed.values_list('author_id', flat=True).first()
+    tag_id = Tag.objects.values_list('id', flat=True).first()
+    user_id = (
+        Favorite.objects.values_list('user_id', flat=True).first()
+        or User.objects.values_list('id', flat=True).first()
+    )
+    page_ids = list(feed.values_list('id', flat=True)[:PAGE_SIZE])
+
+    return {
+        'Лента рецептов': feed[:PAGE_SIZE],
+        'Глубокая страница (курсор)': feed.filter(
+            Q(created__lt=deep['created'])
+            | Q(created=deep['created'], id__lt=deep['id'])
+        )[:PAGE_SIZE],
+        'Рецепты автора': feed.filter(author_id=author_id)[:PAGE_SIZE],
+        'Фильтр по тегу': feed.filter(tags__id=tag_id)[:PAGE_SIZE],
+        'Избранное пользователя': feed.filter(
+            favorites__user_id=user_id
+        )[:PAGE_SIZE],
+        'Ингредиенты страницы': IngredientInRecipe.objects.filter(
+            recipe_id__in=page_ids
+        ),
+        'Теги страницы': RecipeTag.objects.filter(recipe_id__in=page_ids),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Замер горячих запросов к рецептам с составными индексами и без них.
+
+    Команда при необходимости заполняет базу синтетическими данными,
+    выводит план и медианное время каждого запроса. На PostgreSQL
+    индексы и ограничения из recipes.models удаляются внутри
+    транзакции, запросы замеряются повторно, после чего транзакция
+    откатывается.
+    """
+
+    help = 'Сравнение времени запросов к рецептам с индексами и без них'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=DEFAULT_RECIPES,
+            help='Количество синтетических рецептов'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=DEFAULT_USERS,
+            help='Количество синтетических пользователей'
+        )
+        parser.add_argument(
+            '--no-seed',
+            action='store_true',
+            help='Не создавать данные, использовать уже имеющиеся'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=DEFAULT_REPEAT,
+            help='Количество повторов каждого запроса'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше 0')
+
+        if not options['no_seed']:
+            SyntheticData(
+                users=options['users'],
+                recipes=options['recipes'],
+                log=self.stdout.write
+            ).generate()
+
+        queries = hot_queries()
+        # Без индексов замеряется первым, чтобы у замера с индексами
+        # не было преимущества прогретого кэша.
+        before = self.measure_without_indexes(queries, options['repeat'])
+        after = self.measure(queries, options['repeat'])
+
+        for name, (elapsed, plan) in after.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if before is not None:
+                old_elapsed, old_plan = before[name]
+                self.stdout.write(f'Без индексов: {old_elapsed:.2f} мс')
+                self.stdout.write(old_plan)
+            self.stdout.write(f'С индексами: {elapsed:.2f} мс')
+            self.stdout.write(plan)
+
+    @staticmethod
+    def measure(queries, repeat):
+        """
+        Возвращает {название: (медиана в мс, план запроса)}.
+
+        Первый прогон каждого запроса прогревает кэш и не учитывается.
+        """
+
+        results = {}
+
+        for name, queryset in queries.items():
+            list(queryset.all())
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (statistics.median(timings), queryset.explain())
+
+        return results
+
+    def measure_without_indexes(self, queries, repeat):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                'Замер без индексов доступен только на PostgreSQL, '
+                'выводятся результаты для текущей схемы'
+            ))
+            return None
+
+        with transaction.atomic():
+            with connection.schema_editor() as editor:
+                for index in Recipe._meta.indexes:
+                    editor.remove_index(Recipe, index)
+                for model in (IngredientInRecipe, RecipeTag):
+                    for constraint in model._meta.constraints:
+                        editor.remove_constraint(model, constraint)
+            results = self.measure(queries, repeat)
+            transaction.set_rollback(True)
+
+        return results
@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand
+
+from recipes.images import build_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Создание уменьшенных копий картинок для уже загруженных рецептов.
+    """
+
+    help = (
+        'Создает уменьшенные копии и WebP-версии картинок рецептов, '
+        'для которых они еще не построены'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить копии для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        built = failed = 0
+
+        for recipe_id, image, variants in Recipe.objects.values_list(
+            'id', 'image', 'image_variants'
+        ).iterator():
+            if options['all'] or variants.get('source') != image:
+                try:
+                    build_image_variants(recipe_id, image)
+                except Exception as error:
+                    self.stderr.write(f'{image}: {error}')
+                    failed += 1
+                else:
+                    built += 1
+
+        self.stdout.write(
+            f'Обработано картинок: {built}, с ошибками: {failed}'
+        )
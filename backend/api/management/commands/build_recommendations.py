@@ -0,0 +1,39 @@
+from django.core.management import BaseCommand
+
+from recipes.recommendations import BATCH_SIZE, TOP_K, build_similar_recipes
+
+
+class Command(BaseCommand):
+    """
+    Пересчет похожих рецептов по совместным добавлениям в избранное.
+
+    Команда для периодического запуска (например, раз в сутки
+    по cron): результат сохраняется в таблицу SimilarRecipe,
+    из которой отдаются эндпоинты similar и recommended.
+    """
+
+    help = 'Пересчет таблицы похожих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help='Сколько похожих рецептов хранить для каждого'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--min-support',
+            type=int,
+            default=1,
+            help='Минимальное число пользователей, добавивших оба рецепта'
+        )
+
+    def handle(self, *args, **options):
+        saved = build_similar_recipes(
+            top_k=options['top_k'],
+            batch_size=options['batch_size'],
+            min_support=options['min_support'],
+            log=self.stdout.write
+        )
+        self.stdout.write(f'Сохранено похожих рецептов: {saved}')
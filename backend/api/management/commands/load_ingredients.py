@@ -1,24 +1,178 @@
+import csv
 import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.cache import invalidate_reference
 from recipes.models import Ingredient
 
 
+DEFAULT_PATH = 'data/ingredients.json'
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json(file, malformed):
+    """
+    Поэлементно разбирает JSON-массив объектов, читая файл частями.
+
+    Элементы без name или measurement_unit передаются в malformed
+    и пропускаются.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив')
+
+    position = 1
+    number = 0
+
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            row, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Файл JSON оборван')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        number += 1
+        if not isinstance(row, dict) or not (
+            row.get('name') and row.get('measurement_unit')
+        ):
+            malformed(f'элемент {number}: {row!r}')
+            continue
+        yield row['name'], row['measurement_unit']
+
+
+def iter_csv(file, malformed):
+    """
+    Построчно читает CSV-файл вида "название,единица измерения".
+
+    Пустые строки пропускаются, строки без названия или единицы
+    измерения передаются в malformed.
+    """
+
+    reader = csv.reader(file)
+
+    for row in reader:
+        if not any(row):
+            continue
+        if len(row) < 2 or not (row[0] and row[1]):
+            malformed(f'строка {reader.line_num}: {row!r}')
+            continue
+        yield row[0], row[1]
+
+
+def batched(rows, size):
+    """
+    Разбивает поток строк на пачки по size штук.
+    """
+
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+READERS = {
+    '.json': iter_json,
+    '.csv': iter_csv,
+}
+
+
 class Command(BaseCommand):
-    '''
+    """
     Заполнение таблицы Ingredient в БД тестовыми данными.
-    '''
 
-    help = 'Импорт данных из ingredients.json в таблицу recipes_ingredient'
+    Файл читается по частям, новые ингредиенты добавляются пачками
+    через bulk_create в одной транзакции. Уже существующие пары
+    (name, measurement_unit) пропускаются, поэтому команду можно
+    запускать повторно.
+    """
+
+    help = (
+        'Импорт данных из ingredients.json или ingredients.csv '
+        'в таблицу recipes_ingredient'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=DEFAULT_PATH,
+            help='Путь к файлу .json или .csv'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество строк в одном INSERT'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только разобрать файл и показать статистику'
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        batch_size = options['batch_size']
+        reader = READERS.get(path.suffix.lower())
+
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .json и .csv')
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+
+        started = time.perf_counter()
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        total = created = 0
+        skipped = []
+
+        with open(path, 'r', encoding='utf-8') as file, transaction.atomic():
+            for batch in batched(reader(file, skipped.append), batch_size):
+                total += len(batch)
+                ingredients = []
+                for key in batch:
+                    if key in existing:
+                        continue
+                    existing.add(key)
+                    ingredients.append(
+                        Ingredient(name=key[0], measurement_unit=key[1])
+                    )
+                if ingredients and not options['dry_run']:
+                    Ingredient.objects.bulk_create(
+                        ingredients,
+                        ignore_conflicts=True
+                    )
+                created += len(ingredients)
+            if created and not options['dry_run']:
+                transaction.on_commit(
+                    lambda: invalidate_reference(Ingredient)
+                )
 
-    def handle(self, *args, **kwargs):
-        with open('data/ingredients.json', 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        for row in skipped:
+            self.stderr.write(f'Некорректные данные, {row}')
 
-        for row in data:
-            account = Ingredient(
-                name=row['name'],
-                measurement_unit=row['measurement_unit']
-            )
-            account.save()
+        elapsed = time.perf_counter() - started
+        action = 'Будет добавлено' if options['dry_run'] else 'Добавлено'
+        self.stdout.write(
+            f'{action}: {created}, пропущено: {total - created}, '
+            f'некорректных: {len(skipped)}, '
+            f'прочитано строк: {total} за {elapsed:.2f} с '
+            f'({total / elapsed if elapsed else 0:.0f} строк/с)'
+        )
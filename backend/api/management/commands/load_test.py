@@ -0,0 +1,218 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+
+DEFAULT_PATHS = (
+    '/api/recipes/?limit=6',
+    '/api/tags/',
+    '/api/ingredients/?name=мо',
+)
+APPLICATION = 'foodgram.wsgi:application'
+GUNICORN = 'from gunicorn.app.wsgiapp import run; run()'
+START_TIMEOUT = 30
+SLOW_CLIENT_INTERVAL = 1
+
+
+def wait_until_ready(url, process):
+    """
+    Ждет, пока сервер начнет отвечать на запросы.
+    """
+
+    deadline = time.monotonic() + START_TIMEOUT
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError('Сервер завершился при запуске')
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+
+    raise CommandError(f'Сервер не ответил за {START_TIMEOUT} с')
+
+
+def slow_client(base_url, stop):
+    """
+    Медленный клиент: передает заголовки запроса по одному
+    раз в секунду, пока нагрузка не закончится.
+    """
+
+    address = urlsplit(base_url)
+
+    while not stop.is_set():
+        try:
+            with socket.create_connection(
+                (address.hostname, address.port), timeout=5
+            ) as connection:
+                connection.sendall(
+                    f'GET /api/tags/ HTTP/1.1\r\n'
+                    f'Host: {address.hostname}\r\n'.encode()
+                )
+                while not stop.wait(SLOW_CLIENT_INTERVAL):
+                    connection.sendall(b'X-Slow: 1\r\n')
+                connection.sendall(b'\r\n')
+        except OSError:
+            stop.wait(SLOW_CLIENT_INTERVAL)
+
+
+def run_load(base_url, paths, total, concurrency, headers):
+    """
+    Отправляет total запросов в concurrency потоков.
+
+    Возвращает список длительностей успешных запросов в мс
+    и количество ошибок.
+    """
+
+    local = threading.local()
+    urls = [base_url + path for path in paths]
+
+    def send(number):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.headers.update(headers)
+        started = time.perf_counter()
+        try:
+            response = local.session.get(urls[number % len(urls)], timeout=30)
+        except requests.RequestException:
+            return None
+        if response.status_code >= 400:
+            return None
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(send, range(total)))
+
+    timings = [result for result in results if result is not None]
+    return timings, len(results) - len(timings)
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный тест API.
+
+    Запускается gunicorn с --workers воркерами, на него отправляется
+    нагрузка, после чего выводятся пропускная способность и задержки
+    p50/p99. Параметр --slow-clients добавляет соединения, которые
+    передают запрос очень медленно, как клиенты на плохой сети.
+    Вместо запуска сервера можно указать адрес уже работающего
+    через --url.
+    """
+
+    help = 'Пропускная способность и задержки p50/p99 API под нагрузкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес уже запущенного сервера, например '
+                 'http://127.0.0.1:8000'
+        )
+        parser.add_argument(
+            '--paths',
+            nargs='+',
+            default=list(DEFAULT_PATHS),
+            help='Пути, которые запрашиваются по очереди'
+        )
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--slow-clients', type=int, default=0)
+        parser.add_argument(
+            '--token',
+            help='Токен для запросов от имени пользователя'
+        )
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+
+        if options['url']:
+            base_url = options['url'].rstrip('/')
+            self.report(*self.measure(base_url, headers, options))
+            return
+
+        base_url = f'http://127.0.0.1:{options["port"]}'
+        process = self.start_server(options['port'], options['workers'])
+        try:
+            wait_until_ready(base_url + options['paths'][0], process)
+            self.report(*self.measure(base_url, headers, options))
+        finally:
+            process.terminate()
+            process.wait()
+
+    @staticmethod
+    def start_server(port, workers):
+        environment = dict(os.environ)
+        environment['ALLOWED_HOSTS'] = ' '.join(
+            {*settings.ALLOWED_HOSTS, '127.0.0.1'}
+        )
+
+        return subprocess.Popen(
+            [
+                sys.executable, '-c', GUNICORN, APPLICATION,
+                '--bind', f'127.0.0.1:{port}',
+                '--workers', str(workers),
+                '--log-level', 'warning',
+            ],
+            cwd=settings.BASE_DIR,
+            env=environment
+        )
+
+    @staticmethod
+    def measure(base_url, headers, options):
+        stop = threading.Event()
+        slow_clients = [
+            threading.Thread(
+                target=slow_client,
+                args=(base_url, stop),
+                daemon=True
+            )
+            for _ in range(options['slow_clients'])
+        ]
+
+        for client in slow_clients:
+            client.start()
+        if slow_clients:
+            time.sleep(SLOW_CLIENT_INTERVAL)
+
+        started = time.perf_counter()
+        try:
+            timings, errors = run_load(
+                base_url,
+                options['paths'],
+                options['requests'],
+                options['concurrency'],
+                headers
+            )
+        finally:
+            elapsed = time.perf_counter() - started
+            stop.set()
+            for client in slow_clients:
+                client.join()
+
+        return timings, errors, elapsed
+
+    def report(self, timings, errors, elapsed):
+        if len(timings) < 2:
+            self.stdout.write(f'Успешных ответов нет, ошибок {errors}')
+            return
+
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f'{len(timings) / elapsed:.1f} запросов/с, '
+            f'p50 {percentiles[49]:.1f} мс, p99 {percentiles[98]:.1f} мс, '
+            f'ошибок {errors}'
+        )
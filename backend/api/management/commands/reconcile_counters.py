@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    """
+    Сверка денормализованных счетчиков с фактическими данными.
+
+    Счетчики favorites_count, recipes_count и followers_count
+    пересчитываются одним UPDATE на каждый, изменяются только
+    разошедшиеся строки.
+    """
+
+    help = 'Пересчет счетчиков избранного, рецептов и подписчиков'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = reconcile_counters()
+
+        for counter, rows in fixed.items():
+            self.stdout.write(f'{counter}: исправлено строк {rows}')
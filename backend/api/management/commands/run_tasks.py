@@ -0,0 +1,69 @@
+import signal
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from recipes.tasks import DatabaseBackend
+
+
+BATCH_SIZE = 10
+IDLE_SLEEP = 1.0
+
+
+class Command(BaseCommand):
+    """
+    Обработчик очереди фоновых задач (TASK_BACKEND=DatabaseBackend).
+
+    Берет готовые задачи из таблицы Task пачками и выполняет их.
+    Обработчиков можно запустить несколько, одну задачу они
+    не возьмут. По SIGTERM или SIGINT команда завершает текущую
+    задачу и выходит.
+    """
+
+    help = 'Выполнение фоновых задач из таблицы Task'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и выйти'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=IDLE_SLEEP,
+            help='Пауза в секундах, когда готовых задач нет'
+        )
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def handle(self, *args, **options):
+        backend = DatabaseBackend()
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        done = failed = 0
+
+        while not self.stopping:
+            close_old_connections()
+            tasks = backend.claim(options['batch_size'])
+
+            if not tasks:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            for number, task in enumerate(tasks):
+                if self.stopping:
+                    backend.release(tasks[number:])
+                    break
+                if backend.run(task):
+                    done += 1
+                else:
+                    failed += 1
+
+        self.stdout.write(f'Выполнено задач: {done}, с ошибками: {failed}')
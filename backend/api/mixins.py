@@ -0,0 +1,219 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.status import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+
+from recipes.relations import get_relations_version
+
+
+def normalized_query(request):
+    """
+    Параметры запроса, отсортированные по имени и значению.
+    """
+
+    return sorted(
+        (key, sorted(values))
+        for key, values in request.query_params.lists()
+    )
+
+
+class CachedReferenceMixin:
+    """
+    Миксин для вьюсетов справочников.
+
+    Список и отдельный объект читаются из кэша, который возвращает
+    reference_loader в виде словаря {id: объект}. Отбор объектов
+    для списка выполняет filter_reference. Изменяющие запросы
+    идут в базу как обычно.
+    """
+
+    reference_loader = None
+
+    def filter_reference(self):
+        return list(self.reference_loader().values())
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.filter_reference(), many=True)
+        return Response(serializer.data)
+
+    def get_object(self):
+        if self.request.method not in SAFE_METHODS:
+            return super().get_object()
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+
+        try:
+            obj = self.reference_loader()[int(self.kwargs[lookup_url_kwarg])]
+        except (KeyError, ValueError):
+            raise Http404
+
+        self.check_object_permissions(self.request, obj)
+
+        return obj
+
+
+class ConditionalGetMixin:
+    """
+    Миксин условных GET-запросов для list и retrieve.
+
+    ETag строится из версий данных (get_etag_versions), пути,
+    параметров запроса и формата ответа, тело ответа для этого
+    не сериализуется. Если ETag совпадает с If-None-Match,
+    возвращается 304 без обращения к базе. Общие ответы можно
+    кэшировать в nginx на cache_max_age секунд. Если ответ зависит
+    от пользователя (per_user), в ETag добавляется версия его связей,
+    а ответ кэшируется только в браузере с обязательной проверкой.
+    """
+
+    cache_max_age = 0
+    per_user = False
+
+    def get_etag_versions(self):
+        return ()
+
+    def is_private(self, request):
+        return self.per_user and request.user.is_authenticated
+
+    def get_etag(self, request):
+        parts = [
+            *self.get_etag_versions(),
+            request.path,
+            normalized_query(request),
+            request.accepted_media_type,
+        ]
+
+        if self.is_private(request):
+            user_id = request.user.id
+            parts += [user_id, get_relations_version(user_id)]
+
+        return quote_etag(
+            hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+        )
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code not in (HTTP_200_OK, HTTP_304_NOT_MODIFIED):
+            return response
+
+        if getattr(response, 'stale', False):
+            # Устаревшему ответу нельзя давать ETag текущих данных.
+            patch_cache_control(response, no_cache=True)
+        elif self.is_private(request):
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            response['ETag'] = etag
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=self.cache_max_age
+            )
+        if self.per_user:
+            patch_vary_headers(response, ('Authorization',))
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class AnonymousListCacheMixin:
+    """
+    Миксин кэша готовых ответов списка для анонимных пользователей.
+
+    Ключ строится из хоста, пути, отсортированных параметров запроса
+    и формата ответа. Вместе с телом хранится поколение данных
+    (get_etag_versions), запись другого поколения считается
+    устаревшей. Пересобирает страницу только тот процесс, который
+    захватил блокировку. Остальные, пока он работает, получают
+    устаревшую запись, а если ее нет - один раз ждут
+    list_cache_wait секунд и затем строят страницу сами.
+    """
+
+    list_cache_timeout = 5 * 60
+    list_cache_lock_timeout = 5
+    list_cache_wait = 0.05
+
+    def get_list_cache_key(self, request):
+        digest = hashlib.md5(json.dumps([
+            request.scheme,
+            request.get_host(),
+            request.path,
+            normalized_query(request),
+            request.accepted_media_type,
+        ]).encode()).hexdigest()
+
+        return f'responses:{self.basename}:{digest}'
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        generation = list(self.get_etag_versions())
+        cached = cache.get(key)
+
+        if cached is not None and cached[0] == generation:
+            return self.cached_response(cached)
+
+        lock = f'{key}:lock'
+
+        if not cache.add(lock, 1, self.list_cache_lock_timeout):
+            if cached is not None:
+                return self.cached_response(cached, stale=True)
+            time.sleep(self.list_cache_wait)
+            cached = cache.get(key)
+            if cached is not None and cached[0] == generation:
+                return self.cached_response(cached)
+            return super().list(request, *args, **kwargs)
+
+        try:
+            response = self.finalize_response(
+                request,
+                super().list(request, *args, **kwargs)
+            )
+            response.render()
+            if response.status_code == HTTP_200_OK:
+                cache.set(
+                    key,
+                    (generation, response.content, response['Content-Type']),
+                    self.list_cache_timeout
+                )
+        finally:
+            cache.delete(lock)
+
+        return response
+
+    @staticmethod
+    def cached_response(cached, stale=False):
+        """
+        Ответ из записи кэша.
+
+        Устаревший ответ помечается атрибутом stale: ConditionalGetMixin
+        не ставит ему ETag текущей версии данных.
+        """
+
+        _, content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        response.stale = stale
+        return response
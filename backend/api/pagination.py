@@ -1,9 +1,251 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (курсору) без OFFSET.
+
+    Порядок задается атрибутом вьюсета cursor_ordering, последнее
+    поле в нем должно быть уникальным. Курсор хранит значения этих
+    полей у крайнего объекта страницы и направление обхода.
+    Общее количество объектов берется из кэша.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 6
+    max_page_size = 100
+    count_cache_timeout = 60
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(view.cursor_ordering)
+        self.count = self.get_count(queryset, request)
+        limit = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self.invert(field) for field in ordering)
+
+        results = self.fetch(queryset, ordering, position, limit + 1)
+        has_more = len(results) > limit
+        results = results[:limit]
+
+        if reverse:
+            results.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        self.next_position = (
+            self.get_position(results[-1]) if has_next and results else None
+        )
+        self.previous_position = (
+            self.get_position(results[0])
+            if has_previous and results else None
+        )
+
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.encode_cursor(self.next_position, reverse=False),
+            'previous': self.encode_cursor(
+                self.previous_position,
+                reverse=True
+            ),
+            'results': data,
+        })
+
+    def fetch(self, queryset, ordering, position, limit):
+        """
+        Первые limit объектов после позиции в порядке ordering.
+        """
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(ordering, position))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        return list(queryset[:limit])
+
+    def count_objects(self, queryset):
+        return queryset.count()
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_count(self, queryset, request):
+        """
+        Количество объектов, закэшированное для набора фильтров.
+
+        Ключ кэша зависит от пути, параметров запроса (кроме курсора
+        и размера страницы) и пользователя, так как фильтры могут
+        зависеть от него.
+        """
+
+        params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            for value in values
+            if key not in (self.cursor_query_param, self.page_size_query_param)
+        )
+        user_id = request.user.id if request.user.is_authenticated else None
+        digest = hashlib.md5(
+            json.dumps([request.path, params, user_id]).encode()
+        ).hexdigest()
+        key = f'pagination:count:{digest}'
+
+        count = cache.get(key)
+        if count is None:
+            count = self.count_objects(queryset)
+            cache.set(key, count, self.count_cache_timeout)
+
+        return count
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(ordering, position):
+        """
+        Условие "строго после позиции" для заданного порядка.
+
+        Для порядка (-created, -id) это
+        created < c OR (created = c AND id < i).
+        """
+
+        condition = Q()
+
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            term = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(ordering[:index], position[:index]):
+                term &= Q(**{previous.lstrip('-'): value})
+            condition |= term
+
+        return condition
+
+    def get_position(self, obj):
+        position = []
+
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            position.append(value)
+
+        return position
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if not encoded:
+            return None, False
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor['p'], bool(cursor['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or (
+            len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        if position is None:
+            return None
+
+        encoded = base64.urlsafe_b64encode(
+            json.dumps({'p': position, 'r': int(reverse)}).encode()
+        ).decode()
+
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            encoded
+        )
+
+
+class MergedKeysetPagination(KeysetPagination):
+    """
+    Пагинация по ключу для нескольких кверисетов сразу.
+
+    paginate_queryset принимает список кверисетов, у объектов которых
+    есть поля cursor_ordering (все в одном направлении). Из каждого
+    берется страница после курсора, страницы сливаются в одну.
+    """
+
+    def fetch(self, querysets, ordering, position, limit):
+        fetch = super().fetch
+        rows = [
+            row
+            for queryset in querysets
+            for row in fetch(queryset, ordering, position, limit)
+        ]
+        rows.sort(
+            key=lambda row: tuple(
+                getattr(row, field.lstrip('-')) for field in ordering
+            ),
+            reverse=ordering[0].startswith('-')
+        )
+        return rows[:limit]
+
+    def count_objects(self, querysets):
+        return sum(queryset.count() for queryset in querysets)
 
 
 class CustomListPagination(PageNumberPagination):
     """
     Пагинация по параметру запроса limit.
+
+    Если в запросе есть параметр cursor (для первой страницы пустой),
+    а у вьюсета задан cursor_ordering, используется KeysetPagination.
     """
 
     page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+
+        if (
+            KeysetPagination.cursor_query_param in request.query_params
+            and getattr(view, 'cursor_ordering', None)
+        ):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,30 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class PlainTextRenderer(BaseRenderer):
+    """
+    Рендерер для ответов в формате txt.
+
+    Нужен, чтобы параметр запроса format=txt проходил согласование
+    контента. Сообщения об ошибках выводятся построчно.
+    """
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = '\n'.join(str(value) for value in data.values())
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """
+    Рендерер для ответов в формате csv.
+    """
+
+    media_type = 'text/csv'
+    format = 'csv'
@@ -1,25 +1,67 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.relations import PrimaryKeyRelatedField
 
+from recipes.cache import get_ingredients, get_tags
 from recipes.models import (
     IngredientInRecipe,
     Recipe,
+    RecipeTag,
     Tag,
     Ingredient,
     User,
     MIN_AMOUNT_INGREDIENTS
 )
+from recipes.relations import get_relations
+
+
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+SPOOL_SIZE = 1024 * 1024
+# Кратно 4, чтобы каждая часть декодировалась независимо.
+DECODE_CHUNK_SIZE = 64 * 1024
+
+
+def get_recipes_limit(request):
+    """
+    Число рецептов автора из параметра запроса recipes_limit.
+
+    Без параметра или с некорректным значением возвращает None
+    (рецепты не ограничиваются), отрицательное значение считается
+    нулем.
+    """
+
+    try:
+        return max(int(request.query_params['recipes_limit']), 0)
+    except (KeyError, ValueError):
+        return None
 
 
 class Base64ImageField(serializers.ImageField):
     """
     Поле для сериализации картинки.
+
+    Картинка декодируется частями во временный файл, который
+    уходит на диск, если становится больше SPOOL_SIZE. Пробельные
+    символы из base64 удаляются, прочие посторонние символы
+    отклоняются. Слишком большие картинки отклоняются
+    до декодирования.
     """
 
+    default_error_messages = {
+        'too_large': (
+            f'Размер картинки не должен превышать '
+            f'{MAX_IMAGE_SIZE // (1024 * 1024)} МБ'
+        ),
+    }
+
     def to_internal_value(self, data):
         """
         Метод формирующий отображение картинок.
@@ -28,10 +70,71 @@ class Base64ImageField(serializers.ImageField):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, name='temp.' + ext)
 
         return super().to_internal_value(data)
 
+    def decode(self, imgstr, name):
+        if len(imgstr) * 3 // 4 > MAX_IMAGE_SIZE:
+            self.fail('too_large')
+
+        # Переводы строк и пробелы сдвинули бы границы частей.
+        imgstr = ''.join(imgstr.split())
+        file = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+        try:
+            for start in range(0, len(imgstr), DECODE_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    imgstr[start:start + DECODE_CHUNK_SIZE],
+                    validate=True
+                ))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_image')
+
+        file.seek(0)
+        return File(file, name=name)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Поле со ссылками на уменьшенные копии и WebP-версию картинки.
+
+    Пока фоновая обработка не завершилась, возвращает пустой словарь.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image_variants'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+
+        for variant, name in value.items():
+            if variant == 'source':
+                continue
+            url = default_storage.url(name)
+            urls[variant] = (
+                request.build_absolute_uri(url) if request else url
+            )
+
+        return urls
+
+
+class CachedTagField(PrimaryKeyRelatedField):
+    """
+    Поле тега, которое ищет объект по id в кэше тегов.
+    """
+
+    def to_internal_value(self, data):
+        try:
+            return get_tags()[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
 
 class TagSerializer(serializers.ModelSerializer):
     """
@@ -66,12 +169,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
         Метод формирующий поле is_subscribed.
         """
 
-        user = self.context.get('request').user
-
-        return (
-            user.is_authenticated
-            and user.follower.filter(author=obj).exists()
-        )
+        return obj.id in get_relations(self.context.get('request')).following
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -126,7 +224,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     Сериализатор для записи объектов модели Recipe.
     """
 
-    tags = PrimaryKeyRelatedField(
+    tags = CachedTagField(
         queryset=Tag.objects.all(),
         many=True
     )
@@ -147,6 +245,14 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         read_only_fields = ('author',)
 
     def validate_ingredients(self, value):
+        """
+        Проверяет ингредиенты и подставляет найденные объекты.
+
+        Ингредиенты ищутся в кэше справочника, повторы отслеживаются
+        множеством. Найденный объект сохраняется в поле ingredient,
+        чтобы не запрашивать его повторно при создании связей.
+        """
+
         ingredients = value
 
         if not ingredients:
@@ -154,13 +260,13 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 'ingredients': 'Нужен хотя бы 1 ингредиент'
             })
 
-        ingredients_list = []
+        ingredients_ids = set()
+        existing_ingredients = get_ingredients()
 
         for item in ingredients:
             id_obj = item['id']
             amount = item['amount']
-            ingredient = Ingredient.objects.filter(id=id_obj).exists()
-            if not ingredient:
+            if id_obj not in existing_ingredients:
                 raise ValidationError(
                     {'ingredients': f'Ингредиента с id={id_obj} не существует'}
                 )
@@ -172,52 +278,120 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                         f'быть меньше {MIN_AMOUNT_INGREDIENTS}'
                     }
                 )
-            if id_obj in ingredients_list:
+            if id_obj in ingredients_ids:
                 raise ValidationError({
                     'ingredients': 'Ингредианты не должны повторяться'
                 })
-            ingredients_list.append(id_obj)
+            ingredients_ids.add(id_obj)
+            item['ingredient'] = existing_ingredients[id_obj]
 
         return value
 
     def validate_tags(self, value):
+        """
+        Проверяет теги на наличие и повторы.
+
+        Существование тегов уже проверено полем CachedTagField.
+        """
+
         tags = value
-        tags_list = []
 
         if not tags:
             raise ValidationError({
                 'tags': 'Нужен хотя бы 1 тэг'
             })
 
-        for item in tags:
-            tag = Tag.objects.filter(id=item.id)
-            if not tag:
-                raise ValidationError(
-                    {'tags': f'Тега с id={item} не существует'}
-                )
-            if item in tags_list:
-                raise ValidationError({
-                    'ingredients': 'Ингредианты не должны повторяться'
-                })
-            tags_list.append(item)
+        if len({tag.id for tag in tags}) != len(tags):
+            raise ValidationError({
+                'tags': 'Теги не должны повторяться'
+            })
 
         return value
 
     @staticmethod
     def create_ingredients_through_list(ingredients, recipe):
+        if not ingredients:
+            return
         IngredientInRecipe.objects.bulk_create(
             [IngredientInRecipe(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient=ingredient['ingredient'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    @staticmethod
+    def update_tags_through_list(tags, recipe):
+        """
+        Приводит теги рецепта к переданному списку.
+
+        Удаляются только лишние связи и добавляются только недостающие.
+        """
+
+        current = set(
+            RecipeTag.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True
+            )
+        )
+        new = {tag.id for tag in tags}
+
+        if current - new:
+            RecipeTag.objects.filter(
+                recipe=recipe,
+                tag_id__in=current - new
+            ).delete()
+        if new - current:
+            RecipeTag.objects.bulk_create(
+                [RecipeTag(recipe=recipe, tag_id=tag_id)
+                 for tag_id in new - current]
+            )
+
+    @classmethod
+    def update_ingredients_through_list(cls, ingredients, recipe):
+        """
+        Приводит ингредиенты рецепта к переданному списку.
+
+        Связи сравниваются по ингредиенту: лишние удаляются,
+        у оставшихся обновляется количество, если оно изменилось,
+        недостающие добавляются.
+        """
+
+        amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {}
+        to_delete = []
+        to_update = []
+
+        for row in IngredientInRecipe.objects.filter(recipe=recipe):
+            if row.ingredient_id not in amounts:
+                to_delete.append(row.id)
+                continue
+            current[row.ingredient_id] = row
+            if row.amount != amounts[row.ingredient_id]:
+                row.amount = amounts[row.ingredient_id]
+                to_update.append(row)
+
+        if to_delete:
+            IngredientInRecipe.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            IngredientInRecipe.objects.bulk_update(to_update, ['amount'])
+
+        cls.create_ingredients_through_list(
+            [ingredient for ingredient in ingredients
+             if ingredient['ingredient'].id not in current],
+            recipe
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
+        RecipeTag.objects.bulk_create(
+            [RecipeTag(recipe=recipe, tag=tag) for tag in tags]
+        )
 
         self.create_ingredients_through_list(
             recipe=recipe,
@@ -226,19 +400,26 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+        """
+        Обновляет рецепт, меняя только изменившиеся связи.
+
+        Если теги или ингредиенты не переданы (PATCH),
+        они остаются без изменений.
+        """
+
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
 
-        self.create_ingredients_through_list(
-            recipe=instance,
-            ingredients=ingredients
-        )
-        instance.save()
+        if tags is not None:
+            self.update_tags_through_list(recipe=instance, tags=tags)
+        if ingredients is not None:
+            self.update_ingredients_through_list(
+                recipe=instance,
+                ingredients=ingredients
+            )
 
         return instance
 
@@ -247,6 +428,11 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         Метод, отвечающий за формат отображение объекта Ingredient.
         """
         request = self.context.get('request')
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            'ingredientinrecipe__ingredient'
+        )
         return RecipeReadSerializer(
             instance,
             context={'request': request}
@@ -268,6 +454,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    thumbnails = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -280,41 +467,59 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'thumbnails',
             'text',
             'cooking_time'
         )
 
-    def _get_is(self, obj, user_related_name):
-        """
-        Метод формирующий поле is_favorited или is_in_shopping_cart.
-        """
-
-        user = self.context.get('request').user
-
-        return (
-            user.is_authenticated
-            and user_related_name.filter(recipe=obj).exists()
-        )
-
     def get_is_favorited(self, obj):
         """
         Метод формирующий поле is_favorited.
         """
 
-        user = self.context.get('request').user
-        return not user.is_authenticated or self._get_is(obj, user.favorites)
+        relations = get_relations(self.context.get('request'))
+        return obj.id in relations.favorites
 
     def get_is_in_shopping_cart(self, obj):
         """
         Метод формирующий поле is_in_shopping_cart.
         """
 
-        user = self.context.get('request').user
-        return (
-            not user.is_authenticated
-            or self._get_is(obj, user.shopping_list)
+        relations = get_relations(self.context.get('request'))
+        return obj.id in relations.shopping_cart
+
+
+class CoverageRecipeSerializer(RecipeReadSerializer):
+    """
+    Сериализатор рецептов, подобранных по имеющимся ингредиентам.
+
+    covered_count проставляет вьюха, недостающие ингредиенты
+    считаются по набору ingredients из контекста.
+    """
+
+    covered_count = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + (
+            'covered_count',
+            'missing_ingredients',
         )
 
+    def get_missing_ingredients(self, obj):
+        """
+        Метод формирующий поле missing_ingredients.
+        """
+
+        available = self.context['ingredients']
+        return IngredientsInRecipeReadSerializer(
+            [
+                link for link in obj.ingredientinrecipe.all()
+                if link.ingredient_id not in available
+            ],
+            many=True
+        ).data
+
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """
@@ -322,6 +527,7 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
     """
 
     image = Base64ImageField()
+    thumbnails = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -329,63 +535,40 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'thumbnails',
             'cooking_time'
         )
 
 
-class SubscribeSirializer(serializers.ModelSerializer):
+class SubscribeSirializer(CustomUserSerializer):
     """
     Сериализатор для предоставления данных по автору.
+
+    Поле recipes_count берется из счетчика модели, recipes - из
+    префетча (prefetched_recipes) кверисета, если он есть.
     """
 
     recipes = serializers.SerializerMethodField()
-    is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
-    class Meta:
-        model = User
-        fields = (
-            'email',
-            'id',
-            'username',
-            'first_name',
-            'last_name',
-            'is_subscribed',
+    class Meta(CustomUserSerializer.Meta):
+        fields = CustomUserSerializer.Meta.fields + (
             'recipes_count',
             'recipes',
         )
 
-    def get_is_subscribed(self, obj):
-        """
-        Метод формирующий поле is_subscribed.
-        """
-
-        user = self.context.get('request').user
-
-        return (
-            user.is_authenticated
-            and user.follower.filter(author=obj).exists()
-        )
-
-    def get_recipes_count(self, obj):
-        """
-        Метод формирующий поле recipes_count.
-        """
-
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
         """
         Метод формирующий поле recipes.
         """
 
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-        recipes = obj.recipes.all()
+        if hasattr(obj, 'prefetched_recipes'):
+            recipes = obj.prefetched_recipes
+        else:
+            limit = get_recipes_limit(self.context['request'])
+            recipes = obj.recipes.all()
 
-        if limit:
-            limit = int(limit)
-            recipes = recipes[:limit]
+            if limit is not None:
+                recipes = recipes[:limit]
 
         serializer = ShortRecipeSerializer(recipes, many=True, read_only=True)
 
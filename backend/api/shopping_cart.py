@@ -0,0 +1,238 @@
+import csv
+import json
+import os
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Sum
+from django.utils import timezone
+
+from recipes.models import IngredientInRecipe
+from recipes.tasks import enqueue
+
+
+# Сколько секунд хранится состояние выгрузки списка покупок.
+EXPORT_TIMEOUT = 24 * 60 * 60
+EXPORT_CACHE_KEY = 'shopping_cart_export:{token}'
+EXPORT_PENDING = 'pending'
+EXPORT_READY = 'ready'
+# Выгрузка до этого размера (байт) собирается в памяти, больше - на диске.
+EXPORT_MEMORY_SIZE = 1024 * 1024
+# Каталог выгрузок в хранилище: EXPORT_DIR/<token>/<файл>.
+EXPORT_DIR = 'shopping_carts'
+# Не чаще раза в столько секунд удаляются старые выгрузки.
+EXPORT_CLEANUP_INTERVAL = 60 * 60
+EXPORT_CLEANUP_CACHE_KEY = 'shopping_cart_export:cleanup'
+
+
+class Echo:
+    """
+    Псевдо-буфер для csv.writer: вместо записи возвращает строку.
+    """
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartFormat(ABC):
+    """
+    Формат файла списка покупок.
+
+    Строки формируются по одной, поэтому файл отдается потоком,
+    не собираясь целиком в памяти.
+    """
+
+    content_type = None
+
+    def header(self):
+        return ''
+
+    @abstractmethod
+    def row(self, number, ingredient):
+        pass
+
+    def footer(self, total):
+        return ''
+
+    def lines(self, ingredients):
+        """
+        Генератор строк файла по итератору ингредиентов.
+        """
+
+        if header := self.header():
+            yield header
+        total = 0
+
+        for total, ingredient in enumerate(ingredients, start=1):
+            yield self.row(total, ingredient)
+
+        if footer := self.footer(total):
+            yield footer
+
+
+class TxtFormat(ShoppingCartFormat):
+    """
+    Список покупок в формате txt.
+    """
+
+    content_type = 'text/plain; charset=utf-8'
+
+    def row(self, number, ingredient):
+        return (
+            f'{number}) {ingredient["ingredient__name"].capitalize()}'
+            f' — {ingredient["amount"]}'
+            f'{ingredient["ingredient__measurement_unit"]}.\n'
+        )
+
+
+class CsvFormat(ShoppingCartFormat):
+    """
+    Список покупок в формате csv.
+    """
+
+    content_type = 'text/csv; charset=utf-8'
+    writer = csv.writer(Echo())
+
+    def header(self):
+        return self.writer.writerow(('name', 'measurement_unit', 'amount'))
+
+    def row(self, number, ingredient):
+        return self.writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount']
+        ))
+
+
+class JsonFormat(ShoppingCartFormat):
+    """
+    Список покупок в формате json.
+
+    Массив отдается по одному элементу, без сборки документа в памяти.
+    """
+
+    content_type = 'application/json'
+
+    def row(self, number, ingredient):
+        separator = '[\n' if number == 1 else ',\n'
+        return separator + json.dumps(
+            {
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['amount']
+            },
+            ensure_ascii=False
+        )
+
+    def footer(self, total):
+        return '\n]\n' if total else '[]\n'
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': TxtFormat(),
+    'csv': CsvFormat(),
+    'json': JsonFormat(),
+}
+
+
+def shopping_cart_ingredients(user_id):
+    """
+    Ингредиенты списка покупок пользователя, суммированные в базе.
+    """
+
+    return IngredientInRecipe.objects.filter(
+        recipe__shopping_list__user=user_id,
+        recipe__deleted=False
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by(
+        'ingredient__name'
+    )
+
+
+def get_export(token):
+    return cache.get(EXPORT_CACHE_KEY.format(token=token))
+
+
+def set_export(token, export):
+    cache.set(EXPORT_CACHE_KEY.format(token=token), export, EXPORT_TIMEOUT)
+
+
+def export_shopping_cart(token, user_id, file_format, name):
+    """
+    Записывает список покупок в файл хранилища (фоновая задача).
+
+    Файл собирается во временном файле и сохраняется под именем name
+    (или свободным именем рядом), после чего выгрузка token
+    отмечается готовой. Заодно (не чаще раза в
+    EXPORT_CLEANUP_INTERVAL) ставится задача удаления старых выгрузок.
+    """
+
+    shopping_format = SHOPPING_CART_FORMATS[file_format]
+
+    with SpooledTemporaryFile(max_size=EXPORT_MEMORY_SIZE) as buffer:
+        for line in shopping_format.lines(
+            shopping_cart_ingredients(user_id).iterator()
+        ):
+            buffer.write(line.encode())
+        buffer.seek(0)
+        name = default_storage.save(name, File(buffer))
+
+    set_export(token, {
+        'user_id': user_id,
+        'status': EXPORT_READY,
+        'name': name,
+    })
+
+    if cache.add(EXPORT_CLEANUP_CACHE_KEY, 1, EXPORT_CLEANUP_INTERVAL):
+        enqueue(delete_expired_exports)
+
+
+def delete_expired_exports():
+    """
+    Удаляет выгрузки старше EXPORT_TIMEOUT (фоновая задача).
+
+    Состояние выгрузки в кэше к этому времени уже истекло, поэтому
+    скачать такой файл все равно нельзя.
+    """
+
+    expired = timezone.now() - timedelta(seconds=EXPORT_TIMEOUT)
+
+    try:
+        tokens, _ = default_storage.listdir(EXPORT_DIR)
+    except FileNotFoundError:
+        return
+
+    for token in tokens:
+        directory = f'{EXPORT_DIR}/{token}'
+        _, files = default_storage.listdir(directory)
+        left = len(files)
+        for file_name in files:
+            name = f'{directory}/{file_name}'
+            if default_storage.get_modified_time(name) < expired:
+                default_storage.delete(name)
+                left -= 1
+        if not left:
+            remove_empty_directory(directory)
+
+
+def remove_empty_directory(name):
+    """
+    Удаляет пустой каталог, если хранилище локальное.
+    """
+
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        return
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
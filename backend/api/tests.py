@@ -0,0 +1,989 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import override_settings, TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.shopping_cart import (
+    EXPORT_DIR,
+    EXPORT_TIMEOUT,
+    delete_expired_exports,
+    shopping_cart_ingredients
+)
+from api.serializers import RecipeWriteSerializer
+from api.views import RecipeViewSet
+from foodgram.instrumentation import registry
+from recipes.autocomplete import IngredientIndex, SEARCH_LIMIT
+from recipes.counters import reconcile_counters
+from recipes.deletion import purge_recipe
+from recipes.feed import backfill_feed, sync_feed_mode
+from recipes.models import (
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    RecipeTag,
+    ShoppingList,
+    Tag
+)
+from recipes.search import update_search_vectors
+from users.models import Follow, User
+
+
+IMAGE = 'recipes/test.png'
+IMAGE_DATA = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAA'
+    'ggCByxOyYQAAAABJRU5ErkJggg=='
+)
+TEST_MEDIA_ROOT = os.path.join(tempfile.gettempdir(), 'foodgram_test_media')
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f'{username}@example.com',
+        username=username,
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password'
+    )
+
+
+def create_recipe(author, name, tags, ingredients):
+    recipe = Recipe.objects.create(
+        name=name,
+        text='Описание',
+        image=IMAGE,
+        image_variants={'source': IMAGE},
+        cooking_time=10,
+        author=author
+    )
+    recipe.tags.set(tags)
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+def api_client(user=None):
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+class RecipeQueryCountTest(TestCase):
+    """
+    Число запросов списка и карточки рецепта не зависит от размера
+    страницы и количества тегов, ингредиентов и авторов.
+    """
+
+    # Токен, количество рецептов, рецепты с авторами, теги,
+    # ингредиенты и три запроса связей пользователя (избранное,
+    # покупки, подписки). У карточки нет запроса количества.
+    LIST_QUERIES = 8
+    DETAIL_QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        authors = [create_user(f'author{number}') for number in range(5)]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}',
+                color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г'
+            )
+            for number in range(10)
+        ]
+        cls.recipes = [
+            create_recipe(
+                authors[number % len(authors)],
+                f'Рецепт {number}',
+                tags[:1 + number % 3],
+                ingredients[number % 5:number % 5 + 4]
+            )
+            for number in range(30)
+        ]
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client = api_client(self.user)
+
+    def assert_list_queries(self, limit):
+        cache.clear()
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get(f'/api/recipes/?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        self.assert_list_queries(5)
+        self.assert_list_queries(30)
+
+    def test_detail_queries_do_not_depend_on_recipe(self):
+        for recipe in (self.recipes[0], self.recipes[-1]):
+            cache.clear()
+            with self.assertNumQueries(self.DETAIL_QUERIES):
+                response = self.client.get(f'/api/recipes/{recipe.id}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['ingredients']), 4)
+
+
+class RecipeSearchTest(TestCase):
+    """
+    Поиск рецептов по параметру search: на PostgreSQL - полнотекстовый
+    поиск по search_vector, на остальных базах - индекс в памяти.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('cook')
+        cls.user = create_user('reader')
+        tag = Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        beet, cream, cabbage = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Свекла', 'Сметана', 'Капуста')
+        )
+        cls.borscht = create_recipe(author, 'Борщ', [tag], [beet, cream])
+        cls.salad = create_recipe(author, 'Салат', [tag], [beet])
+        cls.soup = create_recipe(author, 'Щи', [tag], [cabbage])
+        cls.soup.text = 'Суп вроде борща, но без свеклы'
+        cls.soup.save()
+        # Ингредиенты добавлены через bulk_create, без сигналов.
+        update_search_vectors()
+
+    def setUp(self):
+        cache.clear()
+        self.client = api_client(self.user)
+
+    def search(self, query):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, 'limit': 10}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_word_forms_of_name_ingredients_and_text(self):
+        self.assertEqual(
+            self.search('свеклой'),
+            [self.salad.id, self.borscht.id, self.soup.id]
+        )
+
+    def test_name_ranks_above_text(self):
+        self.assertEqual(
+            self.search('борщи'),
+            [self.borscht.id, self.soup.id]
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_migration_creates_search_index(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Recipe._meta.db_table
+            )
+        self.assertEqual(
+            constraints['recipe_search_idx']['columns'],
+            ['search_vector']
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_websearch_syntax(self):
+        self.assertCountEqual(
+            self.search('свекла -сметана'),
+            [self.salad.id, self.soup.id]
+        )
+        self.assertCountEqual(
+            self.search('салат or капуста'),
+            [self.salad.id, self.soup.id]
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_cursor_pages_through_equal_ranks(self):
+        ids = [self.borscht.id] + [
+            create_recipe(self.borscht.author, 'Борщ', [], []).id
+            for _ in range(4)
+        ]
+        update_search_vectors()
+
+        found = []
+        response = self.client.get(
+            '/api/recipes/', {'search': 'борщ', 'limit': 2, 'cursor': ''}
+        )
+        # Ограничение на случай, если курсор возвращает ту же страницу.
+        while len(found) <= len(ids) + 1:
+            self.assertEqual(response.status_code, 200)
+            found += [recipe['id'] for recipe in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(found[-1], self.soup.id)
+        self.assertEqual(found[:-1], sorted(ids, reverse=True))
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_vector_follows_recipe_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api_client(self.borscht.author).patch(
+                f'/api/recipes/{self.borscht.id}/',
+                {'name': 'Холодник'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('холодник'), [self.borscht.id])
+        self.assertNotIn(self.borscht.id, self.search('борщ'))
+
+
+@override_settings(FEED_PULL_THRESHOLD=2)
+class FeedTest(TestCase):
+    """
+    Лента подписок: рецепты автора без флага feed_pulled берутся
+    из FeedEntry, с флагом - из Recipe, MergedKeysetPagination
+    сливает оба источника в одном порядке.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.small = create_user('small')
+        cls.big = create_user('big')
+        cls.fans = [create_user(f'fan{number}') for number in range(2)]
+        now = timezone.now()
+        cls.recipes = {cls.small: [], cls.big: [], None: []}
+        for number in range(10):
+            author = (cls.small, cls.big)[number % 2]
+            recipe = create_recipe(author, f'Рецепт {number}', [], [])
+            recipe.created = now - timedelta(minutes=number)
+            recipe.save(update_fields=['created'])
+            cls.recipes[author].append(recipe.id)
+            cls.recipes[None].append(recipe.id)
+        for user in cls.fans:
+            Follow.objects.create(user=user, author=cls.big)
+        # Фоновые задачи в тестах не выполняются, их работа
+        # делается явными вызовами.
+        sync_feed_mode(cls.big.id)
+
+    def follow(self, user, author):
+        Follow.objects.create(user=user, author=author)
+        backfill_feed(user.id, author.id)
+
+    def walk(self, user, limit=2):
+        """
+        id рецептов ленты по страницам вперед и затем назад.
+        """
+
+        client = api_client(user)
+        pages = []
+        url = f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            url = response.data['next']
+        forward = [recipe_id for page in pages for recipe_id in page]
+
+        backward = pages[-1]
+        url = response.data['previous']
+        while url:
+            response = client.get(url)
+            backward = [
+                recipe['id'] for recipe in response.data['results']
+            ] + backward
+            url = response.data['previous']
+        self.assertEqual(backward, forward)
+        return forward
+
+    def test_push_author(self):
+        self.follow(self.reader, self.small)
+        self.assertEqual(self.walk(self.reader), self.recipes[self.small])
+
+    def test_pull_author(self):
+        self.assertTrue(User.objects.get(id=self.big.id).feed_pulled)
+        self.follow(self.reader, self.big)
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.walk(self.reader), self.recipes[self.big])
+
+    def test_push_and_pull_authors(self):
+        self.follow(self.reader, self.small)
+        self.follow(self.reader, self.big)
+        self.assertEqual(self.walk(self.reader, limit=3), self.recipes[None])
+
+    def test_author_below_threshold_keeps_recipes(self):
+        self.follow(self.reader, self.big)
+        Follow.objects.filter(author=self.big, user__in=self.fans).delete()
+        sync_feed_mode(self.big.id)
+
+        self.assertFalse(User.objects.get(id=self.big.id).feed_pulled)
+        self.assertEqual(self.walk(self.reader), self.recipes[self.big])
+
+
+class RecipeDeleteTest(TestCase):
+    """
+    Удаленный рецепт сразу скрывается, а purge_recipe удаляет
+    его вместе с избранным, списками покупок и ингредиентами.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.fan = create_user('fan')
+        ingredient = Ingredient.objects.create(
+            name='Свекла',
+            measurement_unit='г'
+        )
+        cls.recipe = create_recipe(cls.author, 'Борщ', [], [ingredient])
+        cls.other = create_recipe(cls.author, 'Щи', [], [])
+        Favorite.objects.create(user=cls.fan, recipe=cls.recipe)
+        ShoppingList.objects.create(user=cls.fan, recipe=cls.recipe)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_deleted_recipe_is_hidden_until_purged(self):
+        response = api_client(self.author).delete(
+            f'/api/recipes/{self.recipe.id}/'
+        )
+        self.assertEqual(response.status_code, 204)
+
+        client = api_client(self.fan)
+        self.assertEqual(
+            client.get(f'/api/recipes/{self.recipe.id}/').status_code,
+            404
+        )
+        self.assertEqual(client.get('/api/recipes/?is_favorited=1').data, [])
+        self.assertFalse(shopping_cart_ingredients(self.fan.id).exists())
+        self.assertTrue(Favorite.objects.filter(user=self.fan).exists())
+        self.assertEqual(
+            User.objects.get(id=self.author.id).recipes_count,
+            1
+        )
+
+        purge_recipe(self.recipe.id)
+        purge_recipe(self.recipe.id)
+
+        self.assertEqual(list(Recipe.all_objects.all()), [self.other])
+        for model in (Favorite, ShoppingList, IngredientInRecipe):
+            self.assertFalse(model.objects.exists())
+        self.assertEqual(
+            User.objects.get(id=self.author.id).recipes_count,
+            1
+        )
+
+    def test_purge_skips_recipe_that_is_not_deleted(self):
+        purge_recipe(self.recipe.id)
+
+        self.assertTrue(Recipe.objects.filter(id=self.recipe.id).exists())
+        self.assertTrue(Favorite.objects.filter(user=self.fan).exists())
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ExpiredExportsTest(TestCase):
+    """
+    delete_expired_exports удаляет выгрузки старше EXPORT_TIMEOUT
+    и опустевшие каталоги.
+    """
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def save_export(self, token, age):
+        name = default_storage.save(
+            f'{EXPORT_DIR}/{token}/cart.txt',
+            ContentFile('1) Свекла - 1 г.\n'.encode())
+        )
+        modified = time.time() - age
+        os.utime(default_storage.path(name), (modified, modified))
+        return name
+
+    def test_only_expired_exports_are_deleted(self):
+        old = self.save_export('old', EXPORT_TIMEOUT + 60)
+        new = self.save_export('new', 60)
+
+        delete_expired_exports()
+
+        self.assertFalse(default_storage.exists(old))
+        self.assertFalse(default_storage.exists(f'{EXPORT_DIR}/old'))
+        self.assertTrue(default_storage.exists(new))
+
+
+class InstrumentationTest(TestCase):
+    """
+    Метрики запросов: время сериализации, SQL-запросы потоковых
+    ответов и доступ к /metrics.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        ingredient = Ingredient.objects.create(
+            name='Свекла',
+            measurement_unit='г'
+        )
+        recipe = create_recipe(cls.user, 'Борщ', [], [ingredient])
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = api_client(self.user)
+
+    @staticmethod
+    def observed(histogram, view):
+        counts, total = histogram.series.get((view,), ([0], 0))
+        return sum(counts), total
+
+    def test_serializer_time_is_observed_once_per_request(self):
+        view = 'RecipeViewSet.list'
+        before, _ = self.observed(registry.serializer_duration, view)
+
+        self.client.get('/api/recipes/?limit=6')
+
+        after, _ = self.observed(registry.serializer_duration, view)
+        self.assertEqual(after, before + 1)
+
+    def test_streaming_queries_are_recorded_after_stream(self):
+        view = 'RecipeViewSet.download_shopping_cart'
+        before = self.observed(registry.queries, view)
+
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(self.observed(registry.queries, view), before)
+
+        content = b''.join(response.streaming_content)
+        response.close()
+
+        self.assertIn('Свекла', content.decode())
+        count, queries = self.observed(registry.queries, view)
+        self.assertEqual(count, before[0] + 1)
+        self.assertGreater(queries, before[1])
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='secret')
+    def test_metrics_require_token(self):
+        client = APIClient()
+
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'], METRICS_TOKEN='')
+    def test_metrics_allowed_ip(self):
+        client = APIClient()
+
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        response = client.get('/metrics', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 200)
+
+
+class RecipeUpdateTest(TestCase):
+    """
+    Обновление рецепта меняет только изменившиеся связи с тегами
+    и ингредиентами.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}',
+                color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        cls.recipe = create_recipe(
+            cls.author,
+            'Борщ',
+            cls.tags[:2],
+            cls.ingredients[:3]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = api_client(self.author)
+
+    def tag_rows(self):
+        return dict(
+            RecipeTag.objects.filter(recipe=self.recipe).values_list(
+                'tag_id', 'id'
+            )
+        )
+
+    def ingredient_rows(self):
+        return {
+            row.ingredient_id: (row.id, row.amount)
+            for row in IngredientInRecipe.objects.filter(recipe=self.recipe)
+        }
+
+    def ingredients_data(self, amounts):
+        return [
+            {'ingredient': self.ingredients[number], 'amount': amount}
+            for number, amount in amounts.items()
+        ]
+
+    def test_update_changes_only_differences(self):
+        tags = self.tag_rows()
+        ingredients = self.ingredient_rows()
+
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {
+                'tags': [self.tags[1].id, self.tags[2].id],
+                'ingredients': [
+                    {'id': self.ingredients[1].id, 'amount': 1},
+                    {'id': self.ingredients[2].id, 'amount': 5},
+                    {'id': self.ingredients[3].id, 'amount': 2},
+                ],
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        new_tags = self.tag_rows()
+        self.assertEqual(set(new_tags), {self.tags[1].id, self.tags[2].id})
+        self.assertEqual(new_tags[self.tags[1].id], tags[self.tags[1].id])
+
+        new_ingredients = self.ingredient_rows()
+        first, second, third, fourth = (
+            ingredient.id for ingredient in self.ingredients
+        )
+        self.assertNotIn(first, new_ingredients)
+        self.assertEqual(new_ingredients[second], ingredients[second])
+        self.assertEqual(new_ingredients[third], (ingredients[third][0], 5))
+        self.assertEqual(new_ingredients[fourth][1], 2)
+
+    def test_patch_without_relations_keeps_them(self):
+        tags = self.tag_rows()
+        ingredients = self.ingredient_rows()
+
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {'name': 'Зеленый борщ'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.tag_rows(), tags)
+        self.assertEqual(self.ingredient_rows(), ingredients)
+
+    def test_changed_amounts_are_updated_in_one_query(self):
+        ingredients = self.ingredients_data({0: 3, 1: 4, 2: 1})
+
+        # Связи рецепта и один UPDATE для двух строк.
+        with self.assertNumQueries(2):
+            RecipeWriteSerializer.update_ingredients_through_list(
+                ingredients,
+                self.recipe
+            )
+
+        self.assertEqual(
+            {amount for _, amount in self.ingredient_rows().values()},
+            {3, 4, 1}
+        )
+
+    def test_unchanged_update_only_reads_relations(self):
+        ingredients = self.ingredients_data({0: 1, 1: 1, 2: 1})
+
+        with self.assertNumQueries(2):
+            RecipeWriteSerializer.update_tags_through_list(
+                self.tags[:2],
+                self.recipe
+            )
+            RecipeWriteSerializer.update_ingredients_through_list(
+                ingredients,
+                self.recipe
+            )
+
+
+class CounterTest(TestCase):
+    """
+    Счетчики favorites_count, recipes_count и followers_count
+    совпадают с фактическими данными.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.fan = create_user('fan')
+        cls.recipes = [
+            create_recipe(cls.author, f'Рецепт {number}', [], [])
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_counters(self):
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                recipe.favorites_count,
+                Favorite.objects.filter(recipe=recipe).count()
+            )
+        for user in User.objects.all():
+            self.assertEqual(
+                user.recipes_count,
+                Recipe.objects.filter(author=user).count()
+            )
+            self.assertEqual(
+                user.followers_count,
+                Follow.objects.filter(author=user).count()
+            )
+
+    def test_api_actions_keep_counters(self):
+        client = api_client(self.fan)
+        recipe = self.recipes[0]
+        urls = (
+            f'/api/recipes/{recipe.id}/favorite/',
+            f'/api/recipes/{recipe.id}/shopping_cart/',
+            f'/api/users/{self.author.id}/subscribe/',
+        )
+
+        for url in urls:
+            self.assertEqual(client.post(url).status_code, 201)
+            self.assert_counters()
+        self.assertEqual(
+            Recipe.objects.get(id=recipe.id).favorites_count,
+            1
+        )
+        self.assertEqual(
+            User.objects.get(id=self.author.id).followers_count,
+            1
+        )
+
+        for url in urls:
+            self.assertEqual(client.delete(url).status_code, 204)
+            self.assert_counters()
+
+        self.assertEqual(client.post(urls[0]).status_code, 201)
+        response = api_client(self.author).delete(
+            f'/api/recipes/{recipe.id}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_counters()
+        purge_recipe(recipe.id)
+        self.assert_counters()
+        self.assertEqual(User.objects.get(id=self.author.id).recipes_count, 1)
+
+    def test_reconcile_repairs_drift(self):
+        Favorite.objects.create(user=self.fan, recipe=self.recipes[0])
+        Follow.objects.create(user=self.fan, author=self.author)
+        Recipe.objects.update(favorites_count=5)
+        User.objects.update(recipes_count=7, followers_count=3)
+
+        fixed = reconcile_counters()
+
+        self.assertEqual(fixed, {
+            'Recipe.favorites_count': 2,
+            'User.recipes_count': 2,
+            'User.followers_count': 2,
+        })
+        self.assert_counters()
+        self.assertEqual(reconcile_counters(), {
+            'Recipe.favorites_count': 0,
+            'User.recipes_count': 0,
+            'User.followers_count': 0,
+        })
+
+
+class AnonymousListCacheTest(TestCase):
+    """
+    Страницы списка рецептов для анонимных пользователей берутся
+    из кэша до изменения данных, пока страницу пересобирает другой
+    процесс, отдается устаревшая запись.
+    """
+
+    URL = '/api/recipes/'
+    PARAMS = {'limit': 6}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(cls.author, 'Борщ', [], [])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def names(self, response):
+        return [
+            recipe['name'] for recipe in json.loads(response.content)[
+                'results'
+            ]
+        ]
+
+    def rename(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api_client(self.author).patch(
+                f'{self.URL}{self.recipe.id}/',
+                {'name': name},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def page_key(self):
+        request = Request(APIRequestFactory().get(self.URL, self.PARAMS))
+        request.accepted_media_type = 'application/json'
+        view = RecipeViewSet(basename='recipe')
+        return view.get_list_cache_key(request)
+
+    def test_page_is_served_from_cache(self):
+        first = self.client.get(self.URL, self.PARAMS)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.URL, self.PARAMS)
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+
+    def test_write_invalidates_page(self):
+        self.client.get(self.URL, self.PARAMS)
+
+        self.rename('Зеленый борщ')
+
+        response = self.client.get(self.URL, self.PARAMS)
+        self.assertEqual(self.names(response), ['Зеленый борщ'])
+
+    def test_stale_page_is_served_while_locked(self):
+        self.client.get(self.URL, self.PARAMS)
+        self.rename('Зеленый борщ')
+        cache.add(f'{self.page_key()}:lock', 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.URL, self.PARAMS)
+
+        self.assertEqual(self.names(response), ['Борщ'])
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class ConditionalGetTest(TestCase):
+    """
+    Условные GET-запросы: 304 без обращения к базе, пока данные
+    не изменились, и новый ETag после изменения.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.recipe = create_recipe(cls.author, 'Борщ', [], [])
+        cls.url = f'/api/recipes/{cls.recipe.id}/'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_data_is_not_modified(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_update_changes_etag(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            api_client(self.author).patch(
+                self.url,
+                {'name': 'Зеленый борщ'},
+                format='json'
+            )
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Зеленый борщ')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_user_relations_change_etag(self):
+        client = api_client(self.reader)
+        etag = client.get(self.url)['ETag']
+        self.assertIn('private', client.get(self.url)['Cache-Control'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f'{self.url}favorite/')
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class RecipeValidationTest(TestCase):
+    """
+    Проверка тегов и ингредиентов нового рецепта: повторы
+    и несуществующие id.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}',
+                color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г'
+            )
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = api_client(self.author)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def create(self, tags, ingredients):
+        return self.client.post(
+            '/api/recipes/',
+            {
+                'tags': tags,
+                'ingredients': [
+                    {'id': ingredient_id, 'amount': 2}
+                    for ingredient_id in ingredients
+                ],
+                'image': IMAGE_DATA,
+                'name': 'Борщ',
+                'text': 'Описание',
+                'cooking_time': 10,
+            },
+            format='json'
+        )
+
+    def assert_error(self, response, field, message):
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(message, str(response.data[field]))
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_valid_recipe_is_created(self):
+        tag_ids = [tag.id for tag in self.tags]
+        ingredient_ids = [ingredient.id for ingredient in self.ingredients]
+
+        response = self.create(tag_ids, ingredient_ids)
+
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            set(recipe.tags.values_list('id', flat=True)),
+            set(tag_ids)
+        )
+        self.assertEqual(
+            set(recipe.ingredients.values_list('id', flat=True)),
+            set(ingredient_ids)
+        )
+
+    def test_duplicate_ingredients(self):
+        ingredient_id = self.ingredients[0].id
+
+        response = self.create(
+            [self.tags[0].id],
+            [ingredient_id, self.ingredients[1].id, ingredient_id]
+        )
+
+        self.assert_error(response, 'ingredients', 'не должны повторяться')
+
+    def test_unknown_ingredient(self):
+        response = self.create([self.tags[0].id], [0])
+
+        self.assert_error(response, 'ingredients', 'id=0 не существует')
+
+    def test_duplicate_tags(self):
+        response = self.create(
+            [self.tags[0].id, self.tags[0].id],
+            [self.ingredients[0].id]
+        )
+
+        self.assert_error(response, 'tags', 'не должны повторяться')
+
+    def test_unknown_tag(self):
+        response = self.create([0], [self.ingredients[0].id])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class IngredientSearchTest(TestCase):
+    """
+    Поиск ингредиентов по параметру name: сначала совпадения
+    по началу названия, затем по вхождению, не больше SEARCH_LIMIT.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Соль морская', 'Соль', 'Морская капуста', 'Сахар'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, name):
+        response = APIClient().get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_matches_go_first(self):
+        self.assertEqual(
+            self.search('мор'),
+            ['Морская капуста', 'Соль морская']
+        )
+        self.assertEqual(self.search('соль'), ['Соль', 'Соль морская'])
+
+    def test_results_are_limited(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Перец {number:03}', measurement_unit='г')
+            for number in range(SEARCH_LIMIT + 10)
+        )
+        cache.clear()
+
+        self.assertEqual(len(self.search('перец')), SEARCH_LIMIT)
+        self.assertEqual(len(self.search('ец')), SEARCH_LIMIT)
+        index = IngredientIndex(Ingredient.objects.all())
+        self.assertEqual(
+            [ingredient.name for ingredient in index.search('мор', 1)],
+            ['Морская капуста']
+        )
@@ -1,18 +1,26 @@
+from uuid import uuid4
+
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
 
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.status import (
     HTTP_400_BAD_REQUEST,
     HTTP_201_CREATED,
-    HTTP_204_NO_CONTENT
+    HTTP_202_ACCEPTED,
+    HTTP_204_NO_CONTENT,
+    HTTP_404_NOT_FOUND
 )
 from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
 
+from foodgram.instrumentation import SerializerTimingMixin, TimedSerializer
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -21,44 +29,136 @@ from recipes.models import (
     ShoppingList,
     Tag
 )
+from recipes.autocomplete import get_ingredient_index
+from recipes.cache import (
+    get_counters_version,
+    get_ingredients,
+    get_recipes_version,
+    get_reference_version,
+    get_tags
+)
+from recipes.coverage import get_coverage_index
+from recipes.deletion import delete_recipe
+from recipes.feed import FEED_ORDERING, get_feed_sources
+from recipes.recommendations import (
+    TOP_K,
+    get_recommended_ids,
+    get_similar_recipes
+)
+from recipes.relations import get_relations
+from recipes.tasks import enqueue
 
 from .serializers import (
+    CoverageRecipeSerializer,
     RecipeWriteSerializer,
     TagSerializer,
     RecipeReadSerializer,
     ShortRecipeSerializer,
     IngredientSerializer
 )
+from .mixins import (
+    AnonymousListCacheMixin,
+    CachedReferenceMixin,
+    ConditionalGetMixin
+)
 from .permissions import IsAdminOrReadOnly, IsAdminOrIsAuthorOrReadOnly
-from .pagination import CustomListPagination
-from .filters import IngredientListFilter, RecipeListFilter
+from .pagination import CustomListPagination, MergedKeysetPagination
+from .filters import RECIPE_ORDERINGS, RecipeListFilter, get_recipe_ordering
+from .renderers import CSVRenderer, PlainTextRenderer
+from .shopping_cart import (
+    EXPORT_DIR,
+    EXPORT_PENDING,
+    EXPORT_READY,
+    SHOPPING_CART_FORMATS,
+    export_shopping_cart,
+    get_export,
+    set_export,
+    shopping_cart_ingredients
+)
+
+
+REFERENCE_CACHE_MAX_AGE = 5 * 60
+RECIPES_CACHE_MAX_AGE = 10
+COOK_WITH_LIMIT = 1000
+RECOMMENDATIONS_LIMIT = 10
+MAX_RECOMMENDATIONS = 50
 
 
-class TagViewSet(viewsets.ModelViewSet):
+def get_limit(request, default, maximum):
+    """
+    Количество объектов из параметра запроса limit.
+    """
+
+    try:
+        limit = int(request.query_params['limit'])
+    except (KeyError, ValueError):
+        return default
+    return min(max(limit, 1), maximum)
+
+
+class TagViewSet(
+    ConditionalGetMixin,
+    CachedReferenceMixin,
+    SerializerTimingMixin,
+    viewsets.ModelViewSet
+):
     """
     Вьюсет для работы с объектами модели Tag.
     """
 
+    reference_loader = staticmethod(get_tags)
+    cache_max_age = REFERENCE_CACHE_MAX_AGE
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
 
+    def get_etag_versions(self):
+        return (get_reference_version(Tag),)
+
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(
+    ConditionalGetMixin,
+    CachedReferenceMixin,
+    SerializerTimingMixin,
+    viewsets.ModelViewSet
+):
     """
     Вьюсет для работы с объектами модели Ingredient.
+
+    Поиск по параметру name идет по индексу в памяти: сначала
+    ингредиенты, название которых начинается с name, затем те,
+    в названии которых name встречается, всего не больше
+    recipes.autocomplete.SEARCH_LIMIT.
     """
 
+    reference_loader = staticmethod(get_ingredients)
+    cache_max_age = REFERENCE_CACHE_MAX_AGE
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly, )
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientListFilter
+
+    def get_etag_versions(self):
+        return (get_reference_version(Ingredient),)
+
+    def filter_reference(self):
+        name = self.request.query_params.get('name')
+
+        if not name:
+            return super().filter_reference()
+        return get_ingredient_index().search(name)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ConditionalGetMixin,
+    AnonymousListCacheMixin,
+    SerializerTimingMixin,
+    viewsets.ModelViewSet
+):
     """
     Вьюсет для работы с объектами модели Recipe.
+
+    Страницы списка для анонимных пользователей отдаются из кэша,
+    который сбрасывается при изменении рецептов, тегов и ингредиентов.
     """
 
     queryset = Recipe.objects.all()
@@ -67,6 +167,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAdminOrIsAuthorOrReadOnly, )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeListFilter
+    cache_max_age = RECIPES_CACHE_MAX_AGE
+    per_user = True
+
+    def get_etag_versions(self):
+        """
+        Версии данных для ETag и кэша страниц.
+
+        Порядки RECIPE_ORDERINGS строятся по счетчикам, поэтому для них
+        учитывается и версия счетчиков.
+        """
+
+        versions = (
+            get_recipes_version(),
+            get_reference_version(Tag),
+            get_reference_version(Ingredient),
+        )
+
+        if self.request.query_params.get('ordering') in RECIPE_ORDERINGS:
+            versions += (get_counters_version(),)
+        return versions
+
+    @property
+    def cursor_ordering(self):
+        """
+        Порядок для пагинации по курсору, учитывает параметр ordering.
+
+        Курсор есть только у списка рецептов и ленты, остальные
+        действия пагинируются по номеру страницы.
+        """
+
+        if self.action == 'feed':
+            return FEED_ORDERING
+        if self.action != 'list':
+            return None
+        return get_recipe_ordering(self.request)
 
     def get_serializer_class(self):
         """
@@ -80,6 +215,35 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def get_queryset(self):
+        """
+        Метод, формирующий кверисет рецептов.
+
+        Для безопасных запросов авторы, теги и ингредиенты подгружаются
+        пачкой на всю страницу, а признаки is_favorited,
+        is_in_shopping_cart и is_subscribed берутся из связей
+        пользователя (recipes.relations), поэтому число запросов
+        не зависит от размера страницы. Поисковый вектор в ответе
+        не нужен и не загружается.
+        """
+
+        queryset = super().get_queryset()
+
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        return queryset.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredientinrecipe',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
     def perform_create(self, serializer):
         """
         Метод, добавляющий в сериализитор автора поста.
@@ -87,9 +251,23 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        """
+        Метод, удаляющий рецепт.
+
+        Рецепт сразу скрывается, а его строки удаляются в фоне
+        (recipes.deletion.delete_recipe).
+        """
+
+        delete_recipe(instance)
+
+    @transaction.atomic
     def _favorite_or_shopping_cart(self, request, pk, model, text_in_err):
         """
         Метод, добавляющий эндпоинт favorite.
+
+        Связь и счетчик favorites_count рецепта меняются в одной
+        транзакции.
         """
 
         user = request.user
@@ -108,7 +286,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     status=HTTP_400_BAD_REQUEST
                 )
 
-            serializer = ShortRecipeSerializer(recipe)
+            serializer = TimedSerializer(ShortRecipeSerializer(recipe))
 
             return Response(serializer.data, status=HTTP_201_CREATED)
 
@@ -154,37 +332,258 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
     @action(methods=['get'], detail=False)
+    def cook_with(self, request):
+        """
+        Метод, добавляющий эндпоинт cook_with.
+
+        Рецепты из имеющихся ингредиентов (параметры ingredients - id)
+        ранжируются индексом recipes.coverage: сначала те, где покрыто
+        больше ингредиентов, затем те, где меньше недостает.
+        Возвращается не больше COOK_WITH_LIMIT рецептов.
+        """
+
+        try:
+            ingredients = {
+                int(value)
+                for value in request.query_params.getlist('ingredients')
+            }
+        except ValueError:
+            ingredients = None
+
+        if not ingredients:
+            return Response(
+                {'errors': 'Укажите id ингредиентов в параметре ingredients'},
+                status=HTTP_400_BAD_REQUEST
+            )
+
+        ranked = get_coverage_index().rank(ingredients, COOK_WITH_LIMIT)
+        page = self.paginate_queryset(ranked)
+        rows = ranked if page is None else page
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in rows]
+        )
+
+        results = []
+        for recipe_id, covered_count, _ in rows:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.covered_count = covered_count
+                results.append(recipe)
+
+        serializer = TimedSerializer(CoverageRecipeSerializer(
+            results,
+            many=True,
+            context={
+                **self.get_serializer_context(),
+                'ingredients': ingredients,
+            }
+        ))
+
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """
+        Метод, добавляющий эндпоинт feed.
+
+        Лента рецептов авторов из подписок, новые сверху. Собирается
+        из записей ленты пользователя и рецептов популярных авторов
+        (recipes.feed.get_feed_sources), пагинация всегда по курсору.
+        """
+
+        paginator = MergedKeysetPagination()
+        rows = paginator.paginate_queryset(
+            get_feed_sources(request.user),
+            request,
+            self
+        )
+        recipes = self.get_queryset().in_bulk(
+            [row.recipe_id for row in rows]
+        )
+        serializer = TimedSerializer(RecipeReadSerializer(
+            [
+                recipes[row.recipe_id]
+                for row in rows if row.recipe_id in recipes
+            ],
+            many=True,
+            context=self.get_serializer_context()
+        ))
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=['get'], detail=True)
+    def similar(self, request, pk):
+        """
+        Метод, добавляющий эндпоинт similar.
+
+        Похожие рецепты берутся из таблицы SimilarRecipe, которую
+        заполняет команда build_recommendations.
+        """
+
+        get_object_or_404(Recipe.objects.only('id'), id=pk)
+        recipes = get_similar_recipes(
+            pk,
+            get_limit(request, RECOMMENDATIONS_LIMIT, TOP_K)
+        )
+        serializer = TimedSerializer(ShortRecipeSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context()
+        ))
+        return Response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def recommended(self, request):
+        """
+        Метод, добавляющий эндпоинт recommended.
+
+        Рецепты, похожие на избранное пользователя. Если их не хватает
+        (избранного нет или таблица еще не построена), список
+        дополняется популярными рецептами не из избранного.
+        """
+
+        limit = get_limit(request, RECOMMENDATIONS_LIMIT, MAX_RECOMMENDATIONS)
+        ids = get_recommended_ids(request.user, limit)
+        short_recipes = Recipe.objects.defer('text', 'search_vector')
+        found = short_recipes.in_bulk(ids)
+        recipes = [found[recipe_id] for recipe_id in ids if recipe_id in found]
+
+        if len(recipes) < limit:
+            recipes += short_recipes.exclude(id__in=ids).filter(~Exists(
+                Favorite.objects.filter(
+                    user=request.user,
+                    recipe=OuterRef('pk')
+                )
+            )).order_by(*RECIPE_ORDERINGS['popular'])[:limit - len(recipes)]
+
+        serializer = TimedSerializer(ShortRecipeSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context()
+        ))
+        return Response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[JSONRenderer, PlainTextRenderer, CSVRenderer]
+    )
     def download_shopping_cart(self, request):
+        """
+        Метод, добавляющий эндпоинт download_shopping_cart.
+
+        Список покупок агрегируется в базе и отдается потоком
+        в формате txt (по умолчанию), csv или json. Пустой ли список,
+        видно по связям пользователя (recipes.relations) без запроса
+        к базе.
+        """
+
         user = request.user
+        file_format = request.query_params.get('format', 'txt')
+        shopping_format = SHOPPING_CART_FORMATS[file_format]
 
-        if not user.shopping_list.exists():
+        if not get_relations(request).shopping_cart:
             return Response(
                 {'errors': 'В списке покупок пусто, нечего скачивать'},
                 status=HTTP_400_BAD_REQUEST
             )
 
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_list__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            amount=Sum('amount')
-        ).order_by(
-            'ingredient__name'
+        lines = shopping_format.lines(
+            shopping_cart_ingredients(user.id).iterator()
         )
+        filename = f'{user.username}_shopping_cart.{file_format}'
+        response = StreamingHttpResponse(
+            lines,
+            content_type=shopping_format.content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename={filename}'
 
-        shopping_cart = ''
+        return response
+
+    @action(
+        methods=['post'],
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_export(self, request):
+        """
+        Метод, добавляющий эндпоинт shopping_cart_export.
 
-        for number, ingredient in enumerate(ingredients, start=1):
-            shopping_cart += (
-                f'{number}) {ingredient["ingredient__name"].capitalize()}'
-                f' — {ingredient["amount"]}'
-                f'{ingredient["ingredient__measurement_unit"]}.\n'
+        Файл списка покупок (поле format: txt, csv или json) строится
+        фоновой задачей, ответ возвращается сразу. Готовность
+        и ссылку на файл отдает shopping_cart_export/<id>.
+        """
+
+        user = request.user
+        file_format = request.data.get('format', 'txt')
+
+        if file_format not in SHOPPING_CART_FORMATS:
+            return Response(
+                {'errors': 'Формат списка покупок: txt, csv или json'},
+                status=HTTP_400_BAD_REQUEST
             )
 
-        filename = f'{user.username}_shopping_cart.txt'
-        response = HttpResponse(shopping_cart, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+        if not ShoppingList.objects.filter(user=user).exists():
+            return Response(
+                {'errors': 'В списке покупок пусто, нечего скачивать'},
+                status=HTTP_400_BAD_REQUEST
+            )
 
-        return response
+        token = uuid4().hex
+        name = (
+            f'{EXPORT_DIR}/{token}/'
+            f'{user.username}_shopping_cart.{file_format}'
+        )
+        set_export(token, {'user_id': user.id, 'status': EXPORT_PENDING})
+        enqueue(export_shopping_cart, token, user.id, file_format, name)
+
+        return Response(
+            {'id': token, 'status': EXPORT_PENDING, 'url': None},
+            status=HTTP_202_ACCEPTED
+        )
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path=r'shopping_cart_export/(?P<token>[0-9a-f]{32})'
+    )
+    def shopping_cart_export_status(self, request, token):
+        """
+        Метод, добавляющий эндпоинт shopping_cart_export/<id>.
+
+        Пока файл строится, отвечает 202, когда готов - 200
+        со ссылкой на файл.
+        """
+
+        export = get_export(token)
+
+        if export is None or export['user_id'] != request.user.id:
+            return Response(
+                {'errors': 'Выгрузка списка покупок не найдена'},
+                status=HTTP_404_NOT_FOUND
+            )
+
+        if export['status'] != EXPORT_READY:
+            return Response(
+                {'id': token, 'status': export['status'], 'url': None},
+                status=HTTP_202_ACCEPTED
+            )
+
+        return Response({
+            'id': token,
+            'status': export['status'],
+            'url': request.build_absolute_uri(
+                default_storage.url(export['name'])
+            ),
+        })
@@ -0,0 +1,356 @@
+"""
+Метрики запросов к API в формате Prometheus.
+
+InstrumentationMiddleware для каждого запроса измеряет время ответа,
+количество и суммарное время SQL-запросов и складывает их в метрики
+по вьюхе (RecipeViewSet.list, CustomUserViewSet.subscriptions,
+TokenCreateView и т.д.). У потоковых ответов учитываются и запросы,
+выполненные при отдаче потока. Время сериализации учитывают вьюхи
+с SerializerTimingMixin. Метрики хранятся в памяти процесса
+и отдаются вьюхой metrics_view. Запросы дольше
+SLOW_REQUEST_THRESHOLD миллисекунд пишутся в лог вместе с самыми
+долгими SQL-запросами.
+"""
+
+import hmac
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+
+logger = logging.getLogger('foodgram.slow_requests')
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SLOW_QUERIES_IN_LOG = 5
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+class Histogram:
+    """
+    Гистограмма с накопительными корзинами, как в Prometheus.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total = self.series.get(labels, (None, 0))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.series[labels] = (counts, total + value)
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield '_bucket', (*labels, bound), cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+def format_labels(names, values):
+    return ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', r'\\').replace('"', r'\"')
+        )
+        for name, value in zip(names, values)
+    )
+
+
+class Registry:
+    """
+    Набор метрик процесса, изменения защищены блокировкой.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.request_duration = Histogram(
+            'http_request_duration_seconds',
+            'Время ответа на запрос',
+            ('view', 'method', 'status'),
+            DURATION_BUCKETS
+        )
+        self.queries = Histogram(
+            'db_queries_per_request',
+            'Количество SQL-запросов на один запрос к API',
+            ('view',),
+            QUERY_COUNT_BUCKETS
+        )
+        self.query_duration = Histogram(
+            'db_query_duration_seconds',
+            'Суммарное время SQL-запросов одного запроса к API',
+            ('view',),
+            DURATION_BUCKETS
+        )
+        self.serializer_duration = Histogram(
+            'serializer_duration_seconds',
+            'Время сериализации ответа на запрос к API',
+            ('view',),
+            DURATION_BUCKETS
+        )
+        self.metrics = (
+            self.request_duration,
+            self.queries,
+            self.query_duration,
+            self.serializer_duration,
+        )
+
+    def record(self, view, method, status, duration, stats):
+        with self.lock:
+            self.request_duration.observe((view, method, status), duration)
+            self.queries.observe((view,), len(stats.queries))
+            self.query_duration.observe((view,), stats.query_time)
+            if stats.serialized:
+                self.serializer_duration.observe(
+                    (view,),
+                    stats.serializer_time
+                )
+
+    def render(self):
+        lines = []
+
+        with self.lock:
+            for metric in self.metrics:
+                lines.append(f'# HELP {metric.name} {metric.description}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                names = metric.labels
+                if metric.kind == 'histogram':
+                    names += ('le',)
+                for suffix, labels, value in metric.samples():
+                    lines.append(
+                        f'{metric.name}{suffix}'
+                        f'{{{format_labels(names, labels)}}} {value}'
+                    )
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestStats:
+    """
+    Статистика одного запроса: SQL-запросы и время сериализации.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.serializer_time = 0
+        self.serialized = False
+
+    @property
+    def query_time(self):
+        return sum(duration for duration, _ in self.queries)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - started, sql))
+
+
+@contextmanager
+def track_queries(stats):
+    """
+    Учитывает в stats SQL-запросы всех подключений к базам.
+    """
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield
+
+
+class TimedSerializer:
+    """
+    Обертка сериализатора, которая учитывает время обращения к data
+    в статистике текущего запроса. Остальные атрибуты берутся
+    из самого сериализатора.
+    """
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+    @property
+    def data(self):
+        stats = current_stats.get()
+        if stats is None:
+            return self.serializer.data
+        started = time.perf_counter()
+        try:
+            return self.serializer.data
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.serialized = True
+
+
+class SerializerTimingMixin:
+    """
+    Миксин вьюхи, учитывающий время сериализации ответов.
+
+    Сериализаторы из get_serializer оборачиваются в TimedSerializer,
+    действия, которые создают сериализатор сами, оборачивают его явно.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        return TimedSerializer(super().get_serializer(*args, **kwargs))
+
+
+def get_view_name(request):
+    """
+    Имя вьюхи для метки метрик: класс и действие вьюсета.
+    """
+
+    match = request.resolver_match
+
+    if match is None:
+        return 'unmatched'
+
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name or 'unmatched'
+
+    action = (getattr(match.func, 'actions', None) or {}).get(
+        request.method.lower()
+    )
+    return f'{view_class.__name__}.{action}' if action else view_class.__name__
+
+
+class InstrumentationMiddleware:
+    """
+    Собирает метрики каждого запроса и логирует медленные запросы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+
+        try:
+            with track_queries(stats):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content,
+                request,
+                response,
+                started,
+                stats
+            )
+        else:
+            self.record(request, response, started, stats)
+
+        return response
+
+    def stream(self, content, request, response, started, stats):
+        """
+        Отдает поток ответа, учитывая выполненные при этом SQL-запросы.
+
+        Метрики записываются, когда поток отдан или закрыт, время
+        ответа включает отдачу потока.
+        """
+
+        try:
+            with track_queries(stats):
+                yield from content
+        finally:
+            self.record(request, response, started, stats)
+
+    def record(self, request, response, started, stats):
+        duration = time.perf_counter() - started
+        view = get_view_name(request)
+        registry.record(
+            view,
+            request.method,
+            response.status_code,
+            duration,
+            stats
+        )
+
+        if duration * 1000 >= settings.SLOW_REQUEST_THRESHOLD:
+            self.log_slow_request(request, view, duration, stats)
+
+    @staticmethod
+    def log_slow_request(request, view, duration, stats):
+        slowest = sorted(stats.queries, reverse=True)[:SLOW_QUERIES_IN_LOG]
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.0f мс, SQL-запросов %d '
+            'на %.0f мс, сериализация %.0f мс\n%s',
+            request.method,
+            request.get_full_path(),
+            view,
+            duration * 1000,
+            len(stats.queries),
+            stats.query_time * 1000,
+            stats.serializer_time * 1000,
+            '\n'.join(
+                f'{query_time * 1000:.1f} мс: {sql}'
+                for query_time, sql in slowest
+            )
+        )
+
+
+def metrics_allowed(request):
+    """
+    Доступ к метрикам: адрес из METRICS_ALLOWED_IPS или заголовок
+    Authorization: Bearer <METRICS_TOKEN>.
+    """
+
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+
+    if not settings.METRICS_TOKEN:
+        return False
+
+    authorization = request.headers.get('Authorization', '')
+    scheme, _, token = authorization.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(
+        token.encode(),
+        settings.METRICS_TOKEN.encode()
+    )
+
+
+def metrics_view(request):
+    """
+    Метрики процесса в текстовом формате Prometheus.
+    """
+
+    if not metrics_allowed(request):
+        response = HttpResponse('Нет доступа к метрикам\n', status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,90 @@
+"""
+Чтение с реплик базы данных.
+
+ReplicaMiddleware отмечает безопасные запросы (GET, HEAD, OPTIONS),
+ReadReplicaRouter направляет чтения этих запросов на случайную
+реплику, а все записи и остальные чтения - на основную базу.
+После изменяющего запроса клиент на REPLICA_PIN_SECONDS читает
+с основной базы, чтобы видеть свои изменения несмотря на задержку
+репликации.
+"""
+
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+REPLICA_PIN_KEY = 'replicas:pin:{client}'
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != 'default']
+
+
+def get_client_key(request):
+    """
+    Ключ клиента по токену или сессии.
+    """
+
+    credentials = request.headers.get('Authorization') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+
+    if not credentials:
+        return None
+
+    return REPLICA_PIN_KEY.format(
+        client=hashlib.md5(credentials.encode()).hexdigest()
+    )
+
+
+class ReplicaMiddleware:
+    """
+    Разрешает чтение с реплик на время безопасного запроса.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        client = get_client_key(request)
+
+        if request.method not in SAFE_METHODS:
+            if client:
+                cache.set(client, True, settings.REPLICA_PIN_SECONDS)
+            return self.get_response(request)
+
+        token = use_replica.set(not (client and cache.get(client)))
+        try:
+            return self.get_response(request)
+        finally:
+            use_replica.reset(token)
+
+
+class ReadReplicaRouter:
+    """
+    Роутер: чтения безопасных запросов - на реплики,
+    все остальное - на основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+
+        if replicas and use_replica.get():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -50,10 +50,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foodgram.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,10 +91,99 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', '5432')
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # Постоянные соединения: время жизни в секундах, 0 - закрывать
+        # после каждого запроса. Перед повторным использованием
+        # соединение проверяется и при обрыве открывается заново.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', 'True'
+        ) == 'True',
+        # За PgBouncer в режиме transaction серверные курсоры
+        # (QuerySet.iterator) не работают, поэтому при DB_HOST=pgbouncer
+        # они по умолчанию отключены.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_DISABLE_SERVER_SIDE_CURSORS',
+            str(os.getenv('DB_HOST') == 'pgbouncer')
+        ) == 'True',
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS="host1:5432 host2:5432",
+# остальные параметры берутся из основной базы.
+for number, address in enumerate(os.getenv('DB_REPLICA_HOSTS', '').split()):
+    host, _, port = address.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+    }
+
+DATABASE_ROUTERS = ['foodgram.replicas.ReadReplicaRouter']
+
+# Сколько секунд после изменяющего запроса клиент читает
+# с основной базы, а не с реплик.
+REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 5))
+
+# Запросы дольше этого порога (мс) пишутся в лог foodgram.slow_requests.
+SLOW_REQUEST_THRESHOLD = int(os.getenv('SLOW_REQUEST_THRESHOLD', 500))
+
+# Метрики /metrics отдаются адресам из METRICS_ALLOWED_IPS и запросам
+# с заголовком Authorization: Bearer <METRICS_TOKEN>.
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1 ::1').split()
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.slow_requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
+# Кэш хранит версии данных, статус выгрузок и блокировки, поэтому
+# у всех процессов, включая обработчик run_tasks, он должен быть общим
+# (RedisCache). LocMemCache подходит только для одного процесса.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Время жизни кэша связей пользователя (избранное, покупки, подписки)
+# в секундах, 0 отключает кэширование между запросами.
+RELATIONS_CACHE_TIMEOUT = int(os.getenv('RELATIONS_CACHE_TIMEOUT', 60 * 60))
+
+# Рецепты авторов, у которых подписчиков не меньше этого числа,
+# не рассылаются по лентам подписчиков, а читаются при запросе ленты
+# (режим хранится в User.feed_pulled, см. recipes.feed.sync_feed_mode).
+FEED_PULL_THRESHOLD = int(os.getenv('FEED_PULL_THRESHOLD', 10000))
+
+# Очередь фоновых задач (recipes.tasks): recipes.tasks.ThreadBackend -
+# пул потоков в процессе приложения, recipes.tasks.DatabaseBackend -
+# таблица задач, которую обрабатывает команда run_tasks.
+TASK_BACKEND = os.getenv('TASK_BACKEND', 'recipes.tasks.ThreadBackend')
+# Потоков пула ThreadBackend.
+TASK_WORKERS = int(os.getenv('TASK_WORKERS', 2))
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', 3))
+# Задержка перед повтором упавшей задачи в секундах, удваивается
+# с каждой попыткой.
+TASK_RETRY_DELAY = int(os.getenv('TASK_RETRY_DELAY', 10))
+# Сколько секунд взятая задача скрыта от других обработчиков.
+TASK_VISIBILITY_TIMEOUT = int(os.getenv('TASK_VISIBILITY_TIMEOUT', 5 * 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -7,7 +7,8 @@ from .models import (
     IngredientInRecipe,
     Recipe,
     ShoppingList,
-    Tag
+    Tag,
+    Task
 )
 
 
@@ -40,13 +41,16 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author', 'name', 'tags',)
     search_fields = ('author__username', 'name', 'tags__name',)
 
-    @display(description='Количество в избранных')
+    @display(
+        description='Количество в избранных',
+        ordering='favorites_count'
+    )
     def added_in_favorites(self, obj):
         """
         Добавляет в админку общее количество добавлений в избранное.
         """
 
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 class ShoppingListAdmin(admin.ModelAdmin):
@@ -73,9 +77,20 @@ class IngredientInRecipeAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount',)
 
 
+class TaskAdmin(admin.ModelAdmin):
+    """
+    Настройки обображения в админке объектов Task.
+    """
+
+    list_display = ('name', 'status', 'attempts', 'run_at', 'created',)
+    list_filter = ('status', 'name',)
+    readonly_fields = ('last_error',)
+
+
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(ShoppingList, ShoppingListAdmin)
 admin.site.register(Favorite, FavouriteAdmin)
 admin.site.register(IngredientInRecipe, IngredientInRecipeAdmin)
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,90 @@
+from bisect import bisect_left
+from itertools import islice
+
+from .cache import get_ingredients, get_reference_version
+from .models import Ingredient
+
+
+# Сколько ингредиентов возвращает поиск.
+SEARCH_LIMIT = 50
+
+
+class IngredientIndex:
+    """
+    Индекс для автодополнения ингредиентов по названию.
+
+    Названия в нижнем регистре хранятся отсортированным массивом:
+    совпадения по началу строки находятся двоичным поиском,
+    после них идут совпадения по вхождению подстроки. Результатов
+    не больше SEARCH_LIMIT.
+    """
+
+    def __init__(self, ingredients):
+        entries = sorted(
+            (ingredient.name.lower(), ingredient.id, ingredient)
+            for ingredient in ingredients
+        )
+        self.names = [name for name, _, _ in entries]
+        self.ingredients = [ingredient for _, _, ingredient in entries]
+
+    def prefix_range(self, query, limit):
+        """
+        Границы диапазона названий, начинающихся с query,
+        не длиннее limit.
+        """
+
+        start = bisect_left(self.names, query)
+        end = start
+
+        while (
+            end < len(self.names)
+            and end - start < limit
+            and self.names[end].startswith(query)
+        ):
+            end += 1
+
+        return start, end
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """
+        Ищет не больше limit ингредиентов: сначала по началу названия,
+        затем по вхождению.
+
+        Просмотр названий для поиска по вхождению останавливается,
+        как только набрано limit результатов.
+        """
+
+        query = query.lower()
+        start, end = self.prefix_range(query, limit)
+        matches = self.ingredients[start:end]
+
+        if len(matches) < limit:
+            substring_matches = (
+                self.ingredients[position]
+                for position, name in enumerate(self.names)
+                if (position < start or position >= end) and query in name
+            )
+            matches += islice(substring_matches, limit - len(matches))
+
+        return matches
+
+
+# Индекс текущего процесса: (версия справочника, индекс).
+_ingredient_index = (None, None)
+
+
+def get_ingredient_index():
+    """
+    Возвращает индекс ингредиентов, перестраивая его при смене версии.
+    """
+
+    global _ingredient_index
+
+    version = get_reference_version(Ingredient)
+    index_version, index = _ingredient_index
+
+    if index_version != version:
+        index = IngredientIndex(get_ingredients().values())
+        _ingredient_index = (version, index)
+
+    return index
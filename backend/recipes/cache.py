@@ -0,0 +1,173 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from .models import Ingredient, Tag
+
+
+TAGS_CACHE_KEY = 'recipes:tags'
+INGREDIENTS_CACHE_KEY = 'recipes:ingredients'
+RECIPES_CACHE_KEY = 'recipes:recipes'
+COUNTERS_CACHE_KEY = 'recipes:counters'
+# Время жизни справочника в общем кэше (секунды). Даже если копия
+# окажется устаревшей, она не проживет дольше этого времени.
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+
+REFERENCE_CACHE_KEYS = {
+    Tag: TAGS_CACHE_KEY,
+    Ingredient: INGREDIENTS_CACHE_KEY,
+}
+
+# Копии справочников в памяти процесса: {модель: (версия, объекты)}.
+_local_references = {}
+# Словарь слагов тегов и словарь тегов, из которого он построен.
+_tag_slugs = (None, {})
+
+
+def get_version(key):
+    """
+    Возвращает текущую версию данных с ключом key.
+
+    Версия хранится в общем кэше и меняется при каждом изменении
+    данных, поэтому по ней процессы узнают, что их копия устарела.
+    """
+
+    key = f'{key}:version'
+    version = cache.get(key)
+
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+
+    return version
+
+
+def bump_version(key):
+    """
+    Присваивает данным с ключом key новую версию.
+    """
+
+    cache.set(f'{key}:version', uuid4().hex, None)
+
+
+def get_reference_version(model):
+    """
+    Возвращает текущую версию справочной модели.
+    """
+
+    return get_version(REFERENCE_CACHE_KEYS[model])
+
+
+def get_recipes_version():
+    """
+    Возвращает текущую версию данных рецептов.
+
+    Меняется при изменении рецептов, их тегов, ингредиентов,
+    картинок и авторов.
+    """
+
+    return get_version(RECIPES_CACHE_KEY)
+
+
+def invalidate_recipes():
+    """
+    Меняет версию данных рецептов.
+    """
+
+    bump_version(RECIPES_CACHE_KEY)
+
+
+def get_counters_version():
+    """
+    Возвращает текущую версию счетчиков рецептов (favorites_count).
+
+    Отдельна от версии рецептов: счетчики меняются намного чаще,
+    а влияют только на порядок ordering=popular.
+    """
+
+    return get_version(COUNTERS_CACHE_KEY)
+
+
+def invalidate_counters():
+    """
+    Меняет версию счетчиков рецептов.
+    """
+
+    bump_version(COUNTERS_CACHE_KEY)
+
+
+def _get_reference(model):
+    """
+    Возвращает словарь {id: объект} для справочной модели.
+
+    Сначала проверяется копия в памяти процесса, затем общий кэш.
+    При промахе объекты читаются из основной базы одним запросом
+    (реплика может отставать, а запись в кэше живет долго). Данные
+    сохраняются вместе с версией, чтобы запись, начатая до изменения
+    справочника, не подменила новые данные. Возвращаемые объекты
+    общие для всех запросов и не должны изменяться.
+    """
+
+    version = get_reference_version(model)
+    local_version, objects = _local_references.get(model, (None, None))
+
+    if local_version == version:
+        return objects
+
+    key = REFERENCE_CACHE_KEYS[model]
+    cached_version, objects = cache.get(key, (None, None))
+
+    if cached_version != version:
+        objects = {
+            obj.id: obj for obj in model.objects.using('default')
+        }
+        cache.set(key, (version, objects), REFERENCE_CACHE_TIMEOUT)
+
+    _local_references[model] = (version, objects)
+
+    return objects
+
+
+def get_tags():
+    """
+    Словарь тегов {id: Tag} в порядке сортировки модели.
+    """
+
+    return _get_reference(Tag)
+
+
+def get_tag_ids_by_slug():
+    """
+    Словарь {slug: id} тегов.
+
+    Пересобирается, только когда меняется словарь тегов в кэше.
+    """
+
+    global _tag_slugs
+
+    tags = get_tags()
+    source, slugs = _tag_slugs
+
+    if source is not tags:
+        slugs = {tag.slug: tag.id for tag in tags.values()}
+        _tag_slugs = (tags, slugs)
+
+    return slugs
+
+
+def get_ingredients():
+    """
+    Словарь ингредиентов {id: Ingredient} в порядке сортировки модели.
+    """
+
+    return _get_reference(Ingredient)
+
+
+def invalidate_reference(model):
+    """
+    Сбрасывает кэш справочной модели и меняет ее версию.
+    """
+
+    key = REFERENCE_CACHE_KEYS[model]
+    bump_version(key)
+    cache.delete(key)
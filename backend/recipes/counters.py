@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Follow, User
+from .cache import invalidate_counters
+from .models import Favorite, Recipe
+
+
+# Денормализованные счетчики: (модель, поле, связанная модель, внешний ключ).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change_counters(sender, instance, delta):
+    """
+    Атомарно меняет на delta счетчики, которые считают объекты sender.
+
+    После фиксации транзакции меняется версия счетчиков рецептов,
+    если поменялся favorites_count.
+    """
+
+    for model, field, related, foreign_key in COUNTERS:
+        if related is sender:
+            model.objects.filter(
+                pk=getattr(instance, f'{foreign_key}_id')
+            ).update(**{field: Greatest(F(field) + delta, Value(0))})
+            if model is Recipe:
+                transaction.on_commit(invalidate_counters)
+
+
+def actual_count(related, foreign_key):
+    """
+    Подзапрос с фактическим количеством связанных объектов.
+    """
+
+    return Coalesce(
+        Subquery(
+            related.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def reconcile_counters():
+    """
+    Пересчитывает счетчики, разошедшиеся с фактическими данными.
+
+    Возвращает {"Модель.поле": количество исправленных строк}.
+    """
+
+    fixed = {}
+
+    for model, field, related, foreign_key in COUNTERS:
+        actual = actual_count(related, foreign_key)
+        fixed[f'{model.__name__}.{field}'] = model.objects.annotate(
+            actual=actual
+        ).exclude(**{field: F('actual')}).update(**{field: actual})
+
+    transaction.on_commit(invalidate_counters)
+
+    return fixed
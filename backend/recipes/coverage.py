@@ -0,0 +1,119 @@
+import heapq
+import threading
+from array import array
+from collections import Counter, defaultdict
+from itertools import chain
+
+from .cache import get_recipes_version
+from .models import IngredientInRecipe
+from .tasks import close_connections
+
+
+class IngredientCoverageIndex:
+    """
+    Индекс для поиска рецептов по имеющимся ингредиентам.
+
+    Для каждого ингредиента хранится массив id рецептов, в которые
+    он входит, для каждого рецепта - число его ингредиентов.
+    Покрытие рецептов набором ингредиентов считается объединением
+    массивов этих ингредиентов, без обращения к базе.
+    """
+
+    def __init__(self, links):
+        postings = defaultdict(lambda: array('q'))
+        sizes = Counter()
+
+        for recipe_id, ingredient_id in links:
+            postings[ingredient_id].append(recipe_id)
+            sizes[recipe_id] += 1
+
+        self.postings = dict(postings)
+        self.sizes = dict(sizes)
+
+    def rank(self, ingredient_ids, limit=None):
+        """
+        Рецепты, в которые входит хотя бы один из ингредиентов.
+
+        Возвращает список (id рецепта, число покрытых ингредиентов,
+        число недостающих) по убыванию покрытых, затем по возрастанию
+        недостающих. Если задан limit, отбирается столько лучших
+        рецептов без сортировки всех.
+        """
+
+        covered = Counter(chain.from_iterable(
+            self.postings.get(ingredient_id, ())
+            for ingredient_id in set(ingredient_ids)
+        ))
+        ranked = (
+            (recipe_id, count, self.sizes[recipe_id] - count)
+            for recipe_id, count in covered.items()
+        )
+
+        def key(item):
+            recipe_id, count, missing = item
+            return -count, missing, -recipe_id
+
+        if limit is None:
+            return sorted(ranked, key=key)
+        return heapq.nsmallest(limit, ranked, key=key)
+
+
+def load_links():
+    return IngredientInRecipe.objects.using('default').values_list(
+        'recipe_id',
+        'ingredient_id'
+    ).iterator(chunk_size=10000)
+
+
+# Индекс текущего процесса: (версия рецептов, индекс).
+_coverage_index = (None, None)
+# Индекс строит только один поток процесса.
+_rebuild_lock = threading.Lock()
+
+
+def rebuild_coverage_index():
+    """
+    Строит индекс по текущей версии рецептов и подменяет им прежний.
+
+    Версия читается до загрузки связей: если рецепты изменятся
+    во время построения, индекс получит устаревшую версию
+    и будет построен еще раз.
+    """
+
+    global _coverage_index
+
+    with _rebuild_lock:
+        version = get_recipes_version()
+        if _coverage_index[0] != version:
+            _coverage_index = (
+                version,
+                IngredientCoverageIndex(load_links())
+            )
+
+
+def get_coverage_index():
+    """
+    Возвращает индекс покрытия.
+
+    Первый индекс процесса строится прямо в запросе. Когда версия
+    рецептов меняется (ее меняют сигналы при изменении рецептов
+    и их ингредиентов), запросы продолжают получать прежний индекс,
+    а новый строится в фоновом потоке.
+    """
+
+    version = get_recipes_version()
+    index_version, index = _coverage_index
+
+    if index is None:
+        rebuild_coverage_index()
+        return _coverage_index[1]
+
+    if index_version != version and not _rebuild_lock.locked():
+        threading.Thread(
+            target=close_connections,
+            args=(rebuild_coverage_index,),
+            name='coverage-index',
+            daemon=True
+        ).start()
+
+    return index
@@ -0,0 +1,83 @@
+from django.db import connection, transaction
+
+from .cache import invalidate_recipes
+from .counters import change_counters
+from .models import Favorite, IngredientInRecipe, Recipe, ShoppingList
+from .relations import invalidate_relations
+from .tasks import enqueue
+
+
+INVALIDATE_BATCH_SIZE = 1000
+
+
+def invalidate_users_relations(user_ids):
+    """
+    Сбрасывает кэш связей пользователей (фоновая задача).
+    """
+
+    for user_id in user_ids:
+        invalidate_relations(user_id)
+
+
+@transaction.atomic
+def delete_recipe(recipe):
+    """
+    Удаляет рецепт.
+
+    В запросе рецепт только помечается удаленным: он сразу пропадает
+    из Recipe.objects (выдача, избранное, списки покупок), а строки
+    удаляет фоновая задача purge_recipe. Счетчик recipes_count
+    автора уменьшается сразу и не зависит от задачи.
+    """
+
+    if not Recipe.objects.filter(id=recipe.id).update(deleted=True):
+        return
+    change_counters(Recipe, recipe, -1)
+    transaction.on_commit(invalidate_recipes)
+    enqueue(purge_recipe, recipe.id)
+
+
+@transaction.atomic
+def purge_recipe(recipe_id):
+    """
+    Удаляет помеченный рецепт и его строки (фоновая задача).
+
+    Recipe.delete загружает каждую строку избранного, списков покупок
+    и ингредиентов рецепта и отправляет для нее сигналы (счетчики,
+    кэш связей, поисковый вектор): у популярного рецепта это
+    десятки тысяч запросов. Здесь эти строки удаляются одним DELETE
+    на таблицу, без сигналов, а кэш связей затронутых пользователей
+    сбрасывается задачами по INVALIDATE_BATCH_SIZE пользователей.
+    Счетчик favorites_count удаляемого рецепта менять незачем.
+    """
+
+    recipe = Recipe.all_objects.filter(id=recipe_id, deleted=True).first()
+    if recipe is None:
+        return
+
+    user_ids = set()
+
+    for model in (Favorite, ShoppingList, IngredientInRecipe):
+        links = model.objects.filter(recipe=recipe)
+        if model is not IngredientInRecipe:
+            user_ids.update(links.values_list('user_id', flat=True))
+        # QuerySet.delete отправил бы сигналы для каждой строки.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE {} = %s'.format(
+                    connection.ops.quote_name(model._meta.db_table),
+                    connection.ops.quote_name(
+                        model._meta.get_field('recipe').column
+                    )
+                ),
+                [recipe.id]
+            )
+
+    recipe.delete()
+
+    user_ids = sorted(user_ids)
+    for start in range(0, len(user_ids), INVALIDATE_BATCH_SIZE):
+        enqueue(
+            invalidate_users_relations,
+            user_ids[start:start + INVALIDATE_BATCH_SIZE]
+        )
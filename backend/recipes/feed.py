@@ -0,0 +1,195 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef
+
+from users.models import Follow, User
+from .models import FeedEntry, Recipe
+
+
+FEED_ORDERING = ('-created', '-recipe_id')
+FAN_OUT_BATCH_SIZE = 1000
+# Сколько последних рецептов автора попадает в ленту при подписке.
+FEED_BACKFILL_RECIPES = 50
+# Автор возвращается к рассылке, когда подписчиков становится меньше
+# этой доли FEED_PULL_THRESHOLD: иначе режим автора с числом
+# подписчиков около порога переключался бы при каждой подписке.
+FEED_PUSH_SHARE = 0.9
+
+
+def is_pulled(author):
+    """
+    Рецепты автора читаются при запросе ленты, а не рассылаются.
+
+    Режим хранится в поле feed_pulled и меняется только
+    в sync_feed_mode.
+    """
+
+    return author.feed_pulled
+
+
+def backfill_followers(author_id):
+    """
+    Добавляет последние рецепты автора в ленты всех его подписчиков.
+    """
+
+    recipes = list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-created', '-id'
+    ).values_list('id', 'created')[:FEED_BACKFILL_RECIPES])
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True).iterator(
+        chunk_size=FAN_OUT_BATCH_SIZE
+    )
+    entries = (
+        FeedEntry(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            created=created
+        )
+        for user_id in followers
+        for recipe_id, created in recipes
+    )
+
+    while batch := list(islice(entries, FAN_OUT_BATCH_SIZE)):
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def sync_feed_mode(author_id):
+    """
+    Переключает режим ленты автора по числу подписчиков.
+
+    С FEED_PULL_THRESHOLD подписчиков рецепты автора перестают
+    рассылаться и читаются при запросе ленты, записи ленты остаются.
+    Обратно автор переходит, только когда его последние рецепты
+    добавлены в ленты всех подписчиков: рецепты, которые за время
+    чтения при запросе не рассылались, иначе пропали бы из лент.
+    Заполнение повторяется после смены режима для рецептов,
+    опубликованных во время первого прохода.
+    """
+
+    author = User.objects.filter(id=author_id).only(
+        'followers_count',
+        'feed_pulled'
+    ).first()
+
+    if author is None:
+        return
+
+    threshold = settings.FEED_PULL_THRESHOLD
+    authors = User.objects.filter(id=author_id)
+
+    if not author.feed_pulled and author.followers_count >= threshold:
+        authors.update(feed_pulled=True)
+    elif author.feed_pulled and (
+        author.followers_count < threshold * FEED_PUSH_SHARE
+    ):
+        backfill_followers(author_id)
+        authors.update(feed_pulled=False)
+        backfill_followers(author_id)
+
+
+def fan_out_recipe(recipe_id):
+    """
+    Добавляет рецепт в ленты всех подписчиков автора.
+    """
+
+    recipe = Recipe.objects.select_related('author').filter(
+        id=recipe_id
+    ).first()
+
+    if recipe is None or is_pulled(recipe.author):
+        return
+
+    followers = Follow.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True).iterator(
+        chunk_size=FAN_OUT_BATCH_SIZE
+    )
+    entries = (
+        FeedEntry(
+            user_id=user_id,
+            recipe_id=recipe.id,
+            author_id=recipe.author_id,
+            created=recipe.created
+        )
+        for user_id in followers
+    )
+    FeedEntry.objects.bulk_create(
+        entries,
+        batch_size=FAN_OUT_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """
+    Добавляет в ленту подписчика последние рецепты автора.
+
+    Перед этим проверяется режим ленты автора: подписка могла
+    довести число его подписчиков до FEED_PULL_THRESHOLD.
+    """
+
+    sync_feed_mode(author_id)
+    author = User.objects.filter(id=author_id).first()
+
+    if author is None or is_pulled(author) or not Follow.objects.filter(
+        user_id=user_id,
+        author_id=author_id
+    ).exists():
+        return
+
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-created', '-id'
+    ).values_list('id', 'created')[:FEED_BACKFILL_RECIPES]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                created=created
+            )
+            for recipe_id, created in recipes
+        ],
+        ignore_conflicts=True
+    )
+
+
+def remove_from_feed(user_id, author_id):
+    """
+    Убирает из ленты рецепты автора после отписки.
+    """
+
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def get_feed_sources(user):
+    """
+    Кверисеты, из которых собирается лента пользователя.
+
+    Первый - записи ленты (FeedEntry) авторов, на которых пользователь
+    подписан. Если среди них есть авторы, чьи рецепты читаются
+    при запросе ленты (feed_pulled), их рецепты берутся вторым кверисетом
+    прямо из Recipe. У объектов обоих кверисетов есть поля
+    порядка FEED_ORDERING: created и recipe_id.
+    """
+
+    pulled = list(User.objects.filter(
+        following__user=user,
+        feed_pulled=True
+    ).order_by().values_list('id', flat=True))
+    timeline = FeedEntry.objects.filter(user=user).filter(Exists(
+        Follow.objects.filter(user=user, author=OuterRef('author'))
+    )).only('created', 'recipe_id')
+
+    if not pulled:
+        return [timeline]
+
+    return [
+        timeline.exclude(author_id__in=pulled),
+        Recipe.objects.filter(author_id__in=pulled).only(
+            'id', 'created'
+        ).annotate(recipe_id=F('id')),
+    ]
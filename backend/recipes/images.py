@@ -0,0 +1,93 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .cache import invalidate_recipes
+from .models import Recipe
+from .tasks import enqueue
+
+
+THUMBNAIL_SIZES = {
+    'small': 320,
+    'medium': 640,
+}
+WEBP_QUALITY = 80
+
+
+def _save_webp(image, name):
+    """
+    Сохраняет изображение в хранилище в формате WebP.
+
+    Имя копии однозначно выводится из имени оригинала,
+    поэтому прежний файл с тем же именем заменяется.
+    """
+
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+    default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _delete_variants(variants, keep=()):
+    """
+    Удаляет из хранилища файлы копий, кроме оригинала и имен из keep.
+    """
+
+    for variant, name in variants.items():
+        if variant != 'source' and name not in keep:
+            default_storage.delete(name)
+
+
+def build_image_variants(recipe_id, name):
+    """
+    Создает уменьшенные копии и WebP-версию картинки рецепта.
+
+    Имена файлов сохраняются в поле image_variants, только если
+    за время обработки картинка рецепта не поменялась, после чего
+    удаляются копии прежней картинки. Если картинка поменялась,
+    новые копии удаляются, а если до начала обработки - задача
+    ничего не делает.
+    """
+
+    previous = Recipe.objects.filter(id=recipe_id, image=name).values_list(
+        'image_variants',
+        flat=True
+    ).first()
+
+    if previous is None:
+        return
+
+    with default_storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    stem = os.path.splitext(name)[0]
+    variants = {'source': name}
+
+    for size_name, size in THUMBNAIL_SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        variants[size_name] = _save_webp(
+            thumbnail,
+            f'{stem}_{size_name}.webp'
+        )
+    variants['webp'] = _save_webp(image, f'{stem}.webp')
+
+    if Recipe.objects.filter(id=recipe_id, image=name).update(
+        image_variants=variants
+    ):
+        _delete_variants(previous, keep=variants.values())
+        invalidate_recipes()
+    else:
+        _delete_variants(variants)
+
+
+def schedule_image_variants(recipe):
+    """
+    Ставит обработку картинки рецепта в очередь фоновых задач.
+    """
+
+    enqueue(build_image_variants, recipe.id, recipe.image.name)
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.1 on 2026-10-18 04:27
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+# Наибольшее значение PositiveSmallIntegerField.
+MAX_AMOUNT = 32767
+
+
+def delete_duplicate_links(apps, schema_editor):
+    """
+    Удаляет повторные связи рецептов с тегами и ингредиентами.
+
+    Из каждой группы дублей остается строка с наименьшим id.
+    Количество ингредиента в ней заменяется суммой по группе:
+    дубли появляются, например, при объединении одинаковых
+    ингредиентов в миграции 0003.
+    """
+
+    for model_name, fields in (
+        ('RecipeTag', ('tag', 'recipe')),
+        ('IngredientInRecipe', ('recipe', 'ingredient')),
+    ):
+        model = apps.get_model('recipes', model_name)
+        aggregates = {'keep_id': Min('id'), 'total': Count('id')}
+        if model_name == 'IngredientInRecipe':
+            aggregates['amount'] = Sum('amount')
+        duplicates = model.objects.values(*fields).annotate(
+            **aggregates
+        ).filter(total__gt=1)
+
+        for group in duplicates:
+            if 'amount' in group:
+                model.objects.filter(id=group['keep_id']).update(
+                    amount=min(group['amount'], MAX_AMOUNT)
+                )
+            model.objects.filter(
+                **{field: group[field] for field in fields}
+            ).exclude(id=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_links,
+            migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-created', '-id'], name='recipe_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created', '-id'], name='recipe_author_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientinrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_ingredient_in_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipetag',
+            constraint=models.UniqueConstraint(fields=('tag', 'recipe'), name='unique_recipe_tag'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.1 on 2026-10-18 04:31
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Заполняет денормализованные счетчики по текущим данным.
+    """
+
+    for model, field, related, foreign_key in (
+        (('recipes', 'Recipe'), 'favorites_count', ('recipes', 'Favorite'),
+         'recipe'),
+        (('users', 'User'), 'recipes_count', ('recipes', 'Recipe'),
+         'author'),
+        (('users', 'User'), 'followers_count', ('users', 'Follow'),
+         'author'),
+    ):
+        related = apps.get_model(*related)
+        apps.get_model(*model).objects.update(**{field: Coalesce(
+            Subquery(
+                related.objects.filter(
+                    **{foreign_key: OuterRef('pk')}
+                ).order_by().values(foreign_key).annotate(
+                    total=Count('pk')
+                ).values('total')
+            ),
+            0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_indexes_and_unique_links'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество в избранных'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-created', '-id'], name='recipe_popular_idx'),
+        ),
+    ]
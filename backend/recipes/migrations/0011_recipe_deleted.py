@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='deleted',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Удален'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.1 on 2026-10-18 05:45
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Индекс recipe_search_idx строит миграция 0007 (только PostgreSQL),
+    здесь он создается, только если его нет.
+    """
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipe_search_idx ON recipes_recipe '
+            'USING gin (search_vector)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_deleted'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(
+                    create_search_index,
+                    migrations.RunPython.noop
+                ),
+            ],
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import RegexValidator, MinValueValidator
+from django.utils import timezone
 
 
 User = get_user_model()
@@ -33,6 +36,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -73,9 +82,23 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeManager(models.Manager):
+    """
+    Менеджер рецептов без удаленных (deleted).
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted=False)
+
+
 class Recipe(models.Model):
     """
     Модель рецептов.
+
+    Удаляемый рецепт сначала помечается флагом deleted и пропадает
+    из Recipe.objects, а строки удаляются в фоне
+    (recipes.deletion.purge_recipe). Recipe.all_objects видит
+    все рецепты.
     """
 
     name = models.CharField(
@@ -115,14 +138,57 @@ class Recipe(models.Model):
         verbose_name='Теги'
     )
 
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии фото',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество в избранных',
+        default=0,
+        editable=False
+    )
+    # Заполняется recipes.search.update_search_vectors, по нему
+    # построен GIN-индекс recipe_search_idx (в базе - только
+    # в PostgreSQL, миграции 0007 и 0012).
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
     created = models.DateTimeField(
         'Дата добавления', auto_now_add=True
     )
+    deleted = models.BooleanField(
+        verbose_name='Удален',
+        default=False,
+        editable=False
+    )
+
+    objects = RecipeManager()
+    all_objects = models.Manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['-created', '-id'],
+                name='recipe_created_idx'
+            ),
+            models.Index(
+                fields=['author', '-created', '-id'],
+                name='recipe_author_created_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-created', '-id'],
+                name='recipe_popular_idx'
+            ),
+            GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -163,6 +229,12 @@ class IngredientInRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингридиент в рецепте'
         verbose_name_plural = 'Ингридиенты в рецепте'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_ingredient_in_recipe'
+            )
+        ]
 
 
 class RecipeTag(models.Model):
@@ -181,6 +253,14 @@ class RecipeTag(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag', 'recipe'],
+                name='unique_recipe_tag'
+            )
+        ]
+
 
 class Favorite(models.Model):
     """
@@ -250,3 +330,154 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил рецепт {self.recipe} в список покупок'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Модель похожих рецептов.
+
+    Хранит для рецепта несколько самых похожих: тех, которые чаще
+    всего добавляют в избранное вместе с ним. Заполняется командой
+    build_recommendations.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class FeedEntry(models.Model):
+    """
+    Модель ленты подписок.
+
+    Запись о рецепте автора в ленте подписчика. Создается при
+    публикации рецепта (recipes.feed.fan_out_recipe) для авторов
+    без флага feed_pulled; рецепты остальных авторов (с числом
+    подписчиков от FEED_PULL_THRESHOLD) читаются при запросе ленты.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    created = models.DateTimeField('Дата добавления рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-recipe'],
+                name='feed_entry_user_created_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class Task(models.Model):
+    """
+    Модель фоновой задачи.
+
+    Очередь бэкенда recipes.tasks.DatabaseBackend. Выполненные
+    задачи удаляются, задачи, исчерпавшие попытки, остаются
+    со статусом FAILED.
+    """
+
+    PENDING = 'pending'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField(verbose_name='Функция', max_length=255)
+    args = models.JSONField(verbose_name='Аргументы', default=list)
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток'
+    )
+    run_at = models.DateTimeField(
+        verbose_name='Выполнить после',
+        default=timezone.now
+    )
+    # Пока не истекло, задачу выполняет обработчик, который ее взял.
+    locked_until = models.DateTimeField(
+        verbose_name='Занята до',
+        null=True,
+        blank=True
+    )
+    last_error = models.TextField(verbose_name='Ошибка', blank=True)
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(
+                fields=['status', 'run_at'],
+                name='task_status_run_at_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name}{tuple(self.args)}'
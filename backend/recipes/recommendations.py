@@ -0,0 +1,140 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Sum
+
+from .models import Favorite, SimilarRecipe
+
+
+TOP_K = 20
+BATCH_SIZE = 500
+# Сколько последних избранных рецептов пользователя берется
+# для рекомендаций.
+RECOMMENDATION_SEEDS = 50
+
+
+def favorite_counts():
+    """
+    Число добавлений в избранное по рецептам: {id рецепта: число}.
+    """
+
+    return dict(
+        Favorite.objects.values_list('recipe_id').annotate(
+            total=Count('id')
+        ).order_by()
+    )
+
+
+def cooccurrence(recipe_ids):
+    """
+    Совместные добавления в избранное рецептов recipe_ids с другими.
+
+    Строки (рецепт, другой рецепт, число пользователей, у которых
+    в избранном оба) - это строки произведения A^T * A разреженной
+    матрицы "пользователь x рецепт". Оно считается в базе
+    самосоединением таблицы избранного с группировкой.
+    """
+
+    return Favorite.objects.filter(recipe_id__in=recipe_ids).values_list(
+        'recipe_id',
+        'user__favorites__recipe_id'
+    ).annotate(together=Count('id')).order_by()
+
+
+def build_similar_recipes(top_k=TOP_K, batch_size=BATCH_SIZE, min_support=1,
+                          log=None):
+    """
+    Пересчитывает таблицу похожих рецептов.
+
+    Сходство - косинусная мера по избранному:
+    together / sqrt(favorites(a) * favorites(b)). Для каждого
+    рецепта сохраняются top_k самых похожих, пары, которые вместе
+    добавили меньше min_support пользователей, отбрасываются.
+    Рецепты обрабатываются пачками, строки пачки заменяются
+    в одной транзакции, поэтому чтение не прерывается.
+    Возвращает число сохраненных строк.
+    """
+
+    log = log or (lambda message: None)
+    counts = favorite_counts()
+    recipe_ids = sorted(counts)
+    saved = 0
+
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        neighbors = defaultdict(list)
+
+        for recipe_id, other_id, together in cooccurrence(batch):
+            if other_id == recipe_id or together < min_support:
+                continue
+            score = together / math.sqrt(
+                counts.get(recipe_id, together)
+                * counts.get(other_id, together)
+            )
+            neighbors[recipe_id].append((round(score, 6), other_id))
+
+        rows = [
+            SimilarRecipe(
+                recipe_id=recipe_id,
+                similar_id=other_id,
+                score=score
+            )
+            for recipe_id, items in neighbors.items()
+            for score, other_id in heapq.nlargest(top_k, items)
+        ]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.bulk_create(rows)
+
+        saved += len(rows)
+        log(f'Рецептов: {start + len(batch)}, похожих: {saved}')
+
+    SimilarRecipe.objects.filter(
+        ~Exists(Favorite.objects.filter(recipe=OuterRef('recipe')))
+    ).delete()
+
+    return saved
+
+
+def get_similar_recipes(recipe_id, limit):
+    """
+    Самые похожие рецепты: один запрос по индексу (recipe, -score).
+    """
+
+    return [
+        row.similar
+        for row in SimilarRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).select_related('similar').defer(
+            'similar__text',
+            'similar__search_vector'
+        ).order_by('-score', 'similar_id')[:limit]
+    ]
+
+
+def get_recommended_ids(user, limit):
+    """
+    id рецептов, рекомендованных пользователю.
+
+    Складывается сходство с последними RECOMMENDATION_SEEDS
+    рецептами из его избранного, рецепты, которые уже
+    в избранном, пропускаются.
+    """
+
+    favorites = Favorite.objects.filter(user=user)
+    seeds = favorites.order_by('-id').values('recipe_id')[
+        :RECOMMENDATION_SEEDS
+    ]
+
+    return list(
+        SimilarRecipe.objects.filter(recipe_id__in=seeds).filter(
+            ~Exists(favorites.filter(recipe=OuterRef('similar')))
+        ).values('similar_id').annotate(
+            total=Sum('score')
+        ).order_by('-total', 'similar_id').values_list(
+            'similar_id',
+            flat=True
+        )[:limit]
+    )
@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+from users.models import Follow
+from .cache import bump_version, get_version
+from .models import Favorite, ShoppingList
+
+
+RELATIONS_CACHE_KEY = 'relations:{user_id}'
+
+
+@dataclass(frozen=True)
+class Relations:
+    """
+    Связи пользователя: id рецептов в избранном и в списке покупок,
+    id авторов, на которых он подписан.
+    """
+
+    favorites: frozenset = frozenset()
+    shopping_cart: frozenset = frozenset()
+    following: frozenset = frozenset()
+
+
+ANONYMOUS_RELATIONS = Relations()
+
+
+def get_relations_version(user_id):
+    """
+    Возвращает текущую версию связей пользователя.
+    """
+
+    return get_version(RELATIONS_CACHE_KEY.format(user_id=user_id))
+
+
+def load_relations(user_id):
+    """
+    Читает связи пользователя из основной базы тремя запросами.
+
+    Результат кэшируется под текущей версией связей, поэтому чтение
+    с отстающей реплики закрепило бы в кэше данные до изменения.
+    """
+
+    return Relations(
+        favorites=frozenset(
+            Favorite.objects.using('default').filter(
+                user_id=user_id
+            ).values_list('recipe_id', flat=True)
+        ),
+        shopping_cart=frozenset(
+            ShoppingList.objects.using('default').filter(
+                user_id=user_id
+            ).values_list('recipe_id', flat=True)
+        ),
+        following=frozenset(
+            Follow.objects.using('default').filter(
+                user_id=user_id
+            ).values_list('author_id', flat=True)
+        ),
+    )
+
+
+def get_user_relations(user_id):
+    """
+    Возвращает связи пользователя, по возможности из кэша.
+
+    Ключ кэша включает версию связей, которая меняется при каждом
+    их изменении. Если RELATIONS_CACHE_TIMEOUT равен 0, связи
+    между запросами не кэшируются.
+    """
+
+    timeout = settings.RELATIONS_CACHE_TIMEOUT
+
+    if not timeout:
+        return load_relations(user_id)
+
+    version = get_relations_version(user_id)
+    key = f'{RELATIONS_CACHE_KEY.format(user_id=user_id)}:{version}'
+    relations = cache.get(key)
+
+    if relations is None:
+        relations = load_relations(user_id)
+        cache.set(key, relations, timeout)
+
+    return relations
+
+
+def get_relations(request):
+    """
+    Связи текущего пользователя, загружаемые один раз за запрос.
+    """
+
+    user = request.user
+
+    if not user.is_authenticated:
+        return ANONYMOUS_RELATIONS
+
+    if getattr(request, '_relations', None) is None:
+        request._relations = get_user_relations(user.id)
+
+    return request._relations
+
+
+def invalidate_relations(user_id):
+    """
+    Меняет версию связей пользователя, старая запись в кэше
+    больше не читается и удаляется по таймауту.
+    """
+
+    bump_version(RELATIONS_CACHE_KEY.format(user_id=user_id))
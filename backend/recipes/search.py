@@ -0,0 +1,285 @@
+import math
+import re
+from collections import defaultdict
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector
+)
+from django.db import connection, connections
+from django.db.models import (
+    Aggregate,
+    Case,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    TextField,
+    Value,
+    When
+)
+from django.db.models.functions import Cast
+
+from .cache import get_ingredients, get_recipes_version, get_reference_version
+from .models import Ingredient, IngredientInRecipe, Recipe
+
+
+SEARCH_CONFIG = 'russian'
+# Сколько лучших результатов отдает индекс в памяти процесса.
+FALLBACK_RESULTS_LIMIT = 1000
+
+# Веса полей как у ts_rank: A - название, B - ингредиенты, C - описание.
+WEIGHT_A = 1.0
+WEIGHT_B = 0.4
+WEIGHT_C = 0.2
+
+WORD_RE = re.compile(r'\w+')
+VOWELS = 'аеиоуыэюя'
+STOP_WORDS = frozenset((
+    'а', 'без', 'в', 'во', 'да', 'для', 'до', 'и', 'из', 'или', 'к',
+    'на', 'над', 'не', 'но', 'о', 'об', 'от', 'по', 'под', 'при',
+    'с', 'со', 'у',
+))
+ENDINGS = sorted(
+    (
+        'ившись', 'ывшись', 'вшись', 'ивши', 'ывши', 'вши',
+        'ейшая', 'ейший', 'ейшее', 'ость', 'ости', 'остью',
+        'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'ием', 'ией', 'ям',
+        'ам', 'ом', 'ем', 'ов', 'ев', 'ей', 'ой', 'ий', 'ый', 'ая', 'яя',
+        'ое', 'ее', 'ые', 'ие', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+        'ую', 'юю', 'ых', 'их', 'ия', 'ью', 'ию',
+        'ться', 'тся', 'ешь', 'ете', 'ить', 'ать', 'ять', 'еть',
+        'ешься', 'ется', 'ются', 'ть', 'ся',
+        'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+    ),
+    key=len,
+    reverse=True
+)
+
+
+def stem(word):
+    """
+    Упрощенный стемминг русских слов: отбрасывает окончание.
+
+    Окончание ищется только после первой гласной, как в алгоритме
+    Snowball, поэтому короткие слова не обрезаются до пары букв.
+    """
+
+    word = word.replace('ё', 'е')
+
+    for position, letter in enumerate(word):
+        if letter in VOWELS:
+            break
+    else:
+        return word
+
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) > position:
+            return word[:-len(ending)]
+
+    return word
+
+
+def tokenize(text):
+    """
+    Основы слов текста без стоп-слов.
+    """
+
+    return [
+        stem(word)
+        for word in WORD_RE.findall(text.lower())
+        if word not in STOP_WORDS
+    ]
+
+
+class RecipeSearchIndex:
+    """
+    Инвертированный индекс рецептов в памяти процесса.
+
+    Для каждой основы слова хранится словарь {id рецепта: вес},
+    вес складывается из весов полей, в которых встретилось слово.
+    Используется, когда база данных не PostgreSQL.
+    """
+
+    def __init__(self, documents):
+        self.postings = defaultdict(dict)
+        self.size = 0
+
+        for recipe_id, fields in documents:
+            self.size += 1
+            for text, weight in fields:
+                for term in tokenize(text):
+                    postings = self.postings[term]
+                    postings[recipe_id] = postings.get(recipe_id, 0) + weight
+
+    def search(self, query, limit=None):
+        """
+        Рецепты, в которых есть все слова запроса.
+
+        Возвращает список (id, оценка) по убыванию оценки. Оценка -
+        сумма весов слов, умноженных на их редкость (idf).
+        """
+
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        postings = sorted(
+            (self.postings.get(term, {}) for term in terms),
+            key=len
+        )
+        rarest, others = postings[0], postings[1:]
+        if not rarest:
+            return []
+        idf = [math.log(1 + self.size / len(item)) for item in postings]
+
+        ranked = [
+            (
+                recipe_id,
+                round(sum(
+                    item[recipe_id] * rarity
+                    for item, rarity in zip(postings, idf)
+                ), 6)
+            )
+            for recipe_id in rarest
+            if all(recipe_id in item for item in others)
+        ]
+        ranked.sort(key=lambda item: (-item[1], -item[0]))
+
+        return ranked[:limit]
+
+
+def load_documents():
+    """
+    Поля рецептов для индекса: название, ингредиенты и описание.
+    """
+
+    ingredients = get_ingredients()
+    names = defaultdict(list)
+
+    for recipe_id, ingredient_id in IngredientInRecipe.objects.values_list(
+        'recipe_id', 'ingredient_id'
+    ).iterator():
+        if ingredient_id in ingredients:
+            names[recipe_id].append(ingredients[ingredient_id].name)
+
+    for recipe_id, name, text in Recipe.objects.values_list(
+        'id', 'name', 'text'
+    ).iterator():
+        yield recipe_id, (
+            (name, WEIGHT_A),
+            (' '.join(names[recipe_id]), WEIGHT_B),
+            (text, WEIGHT_C),
+        )
+
+
+# Индекс текущего процесса: (версии данных, индекс).
+_search_index = (None, None)
+
+
+def get_search_index():
+    """
+    Возвращает индекс рецептов, перестраивая его при смене версий
+    рецептов или ингредиентов.
+    """
+
+    global _search_index
+
+    version = (get_recipes_version(), get_reference_version(Ingredient))
+    index_version, index = _search_index
+
+    if index_version != version:
+        index = RecipeSearchIndex(load_documents())
+        _search_index = (version, index)
+
+    return index
+
+
+class JoinedNames(Aggregate):
+    """
+    Названия через пробел (STRING_AGG), без импорта
+    django.contrib.postgres.aggregates, которому нужен psycopg2.
+    """
+
+    function = 'STRING_AGG'
+    template = "%(function)s(%(expressions)s, ' ')"
+    output_field = TextField()
+
+
+def search_vector():
+    """
+    Выражение tsvector рецепта: название, ингредиенты и описание
+    с весами A, B и C.
+    """
+
+    ingredient_names = IngredientInRecipe.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=JoinedNames('ingredient__name')
+    ).values('names')
+
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(ingredient_names),
+            weight='B',
+            config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipes=None):
+    """
+    Пересчитывает search_vector у рецептов (по умолчанию у всех).
+
+    На базах, кроме PostgreSQL, ничего не делает: там поиск
+    идет по индексу в памяти процесса.
+    """
+
+    if connection.vendor != 'postgresql':
+        return
+
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    recipes.update(search_vector=search_vector())
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты, подходящие под поисковый запрос, с оценкой rank.
+
+    В PostgreSQL используется полнотекстовый поиск по search_vector
+    (индекс GIN), в остальных базах - RecipeSearchIndex, из которого
+    берутся FALLBACK_RESULTS_LIMIT лучших рецептов.
+    """
+
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            query,
+            config=SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        # ts_rank возвращает real: в курсоре пагинации значение
+        # сохраняется как double и не совпало бы с исходным при
+        # сравнении, поэтому оценка сразу приводится к double.
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=Cast(
+                SearchRank(F('search_vector'), search_query),
+                FloatField()
+            )
+        )
+
+    ranked = get_search_index().search(query, FALLBACK_RESULTS_LIMIT)
+    if not ranked:
+        return queryset.none().annotate(
+            rank=Value(0, output_field=FloatField())
+        )
+
+    return queryset.filter(
+        pk__in=[recipe_id for recipe_id, _ in ranked]
+    ).annotate(rank=Case(
+        *(When(pk=recipe_id, then=score) for recipe_id, score in ranked),
+        output_field=FloatField()
+    ))
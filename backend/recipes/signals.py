@@ -0,0 +1,237 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from users.models import Follow, User
+from .cache import invalidate_recipes, invalidate_reference
+from .counters import change_counters
+from .feed import (
+    backfill_feed,
+    fan_out_recipe,
+    remove_from_feed,
+    sync_feed_mode
+)
+from .images import schedule_image_variants
+from .models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    RecipeTag,
+    ShoppingList,
+    Tag
+)
+from .relations import invalidate_relations
+from .search import update_search_vectors
+from .tasks import enqueue
+
+
+# Поля автора в ответах с рецептами (CustomUserSerializer).
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reference_changed(sender, **kwargs):
+    """
+    Сбрасывает кэш тегов или ингредиентов при их изменении.
+
+    Версия меняется сразу и еще раз после фиксации транзакции:
+    справочник, прочитанный другим запросом до фиксации, сохранен
+    под промежуточной версией и не будет использован.
+    """
+
+    invalidate_reference(sender)
+    transaction.on_commit(lambda: invalidate_reference(sender))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    """
+    Запускает обработку картинки рецепта, если она поменялась.
+    """
+
+    if instance.image and (
+        instance.image_variants.get('source') != instance.image.name
+    ):
+        schedule_image_variants(instance)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def counted_object_created(sender, instance, created, raw=False, **kwargs):
+    """
+    Увеличивает денормализованные счетчики при создании объекта.
+    """
+
+    if created and not raw:
+        change_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def counted_object_deleted(sender, instance, **kwargs):
+    """
+    Уменьшает денормализованные счетчики при удалении объекта.
+
+    Счетчики скрытого рецепта (Recipe.deleted) уже уменьшены
+    при скрытии (recipes.deletion.delete_recipe).
+    """
+
+    if sender is Recipe and instance.deleted:
+        return
+    change_counters(sender, instance, -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def relations_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш связей пользователя.
+
+    Версия меняется сразу, чтобы текущий запрос прочитал новые связи,
+    и еще раз после фиксации транзакции, чтобы не осталась копия,
+    прочитанная другим запросом до фиксации.
+    """
+
+    user_id = instance.user_id
+    invalidate_relations(user_id)
+    transaction.on_commit(lambda: invalidate_relations(user_id))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipes_changed(sender, **kwargs):
+    """
+    Меняет версию данных рецептов после фиксации транзакции.
+    """
+
+    transaction.on_commit(invalidate_recipes)
+
+
+def author_fields(user):
+    """
+    Значения полей пользователя, которые выводятся в рецептах.
+
+    Отложенные (не загруженные) поля не читаются из базы.
+    """
+
+    return tuple(user.__dict__.get(field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_author_fields(sender, instance, **kwargs):
+    instance._author_fields = author_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None,
+                   raw=False, **kwargs):
+    """
+    Меняет версию данных рецептов, если поменялись данные автора.
+
+    Регистрация и сохранение других полей (пароль, last_login,
+    счетчики) на рецепты не влияют.
+    """
+
+    if created or raw or (
+        update_fields is not None
+        and not set(AUTHOR_FIELDS) & set(update_fields)
+    ):
+        return
+
+    fields = author_fields(instance)
+    if fields != instance._author_fields:
+        instance._author_fields = fields
+        transaction.on_commit(invalidate_recipes)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_text_changed(sender, instance, update_fields=None, raw=False,
+                        **kwargs):
+    """
+    Пересчитывает поисковый вектор рецепта после фиксации транзакции.
+
+    К этому моменту ингредиенты рецепта, которые сериализатор
+    записывает после самого рецепта, уже сохранены.
+    """
+
+    if raw or (
+        update_fields is not None
+        and not {'name', 'text'} & set(update_fields)
+    ):
+        return
+    recipe_id = instance.id
+    transaction.on_commit(lambda: update_search_vectors(
+        Recipe.objects.filter(id=recipe_id)
+    ))
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    """
+    Пересчитывает поисковый вектор рецепта при смене ингредиентов.
+    """
+
+    recipe_id = instance.recipe_id
+    transaction.on_commit(lambda: update_search_vectors(
+        Recipe.objects.filter(id=recipe_id)
+    ))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    """
+    Пересчитывает поисковые векторы рецептов с ингредиентом.
+    """
+
+    if created:
+        return
+    ingredient_id = instance.id
+    transaction.on_commit(lambda: update_search_vectors(
+        Recipe.objects.filter(ingredientinrecipe__ingredient=ingredient_id)
+    ))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, raw=False, **kwargs):
+    """
+    Рассылает новый рецепт по лентам подписчиков в фоне.
+    """
+
+    if created and not raw:
+        enqueue(fan_out_recipe, instance.id)
+
+
+@receiver(post_save, sender=Follow)
+def author_followed(sender, instance, created, raw=False, **kwargs):
+    """
+    Добавляет в ленту последние рецепты автора после подписки.
+    """
+
+    if created and not raw:
+        enqueue(backfill_feed, instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def author_unfollowed(sender, instance, **kwargs):
+    """
+    Убирает рецепты автора из ленты после отписки и проверяет
+    в фоне режим ленты автора.
+    """
+
+    remove_from_feed(instance.user_id, instance.author_id)
+    enqueue(sync_feed_mode, instance.author_id)
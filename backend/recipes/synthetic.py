@@ -0,0 +1,210 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from users.models import Follow, User
+from .cache import invalidate_recipes, invalidate_reference
+from .counters import reconcile_counters
+from .models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    RecipeTag,
+    ShoppingList,
+    Tag
+)
+from .search import update_search_vectors
+
+
+SYNTHETIC_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+SYNTHETIC_INGREDIENTS = 500
+SYNTHETIC_IMAGE = 'recipes/temp.png'
+SYNTHETIC_PERIOD = timedelta(days=365)
+
+
+@contextmanager
+def explicit_created():
+    """
+    Позволяет задавать Recipe.created вручную при bulk_create.
+    """
+
+    field = Recipe._meta.get_field('created')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SyntheticData:
+    """
+    Детерминированный генератор тестовых данных.
+
+    Создает пользователей, рецепты с тегами и ингредиентами,
+    подписки, избранное и списки покупок через bulk_create.
+    При одинаковом seed и пустой базе данные совпадают.
+    bulk_create не отправляет сигналы, поэтому в конце
+    счетчики пересчитываются.
+    """
+
+    def __init__(self, users=100, recipes=1000, follows=10, favorites=20,
+                 carts=5, ingredients_per_recipe=(3, 12),
+                 tags_per_recipe=(1, 3), batch_size=5000, seed=0,
+                 log=None):
+        self.users_count = users
+        self.recipes_count = recipes
+        self.follows = follows
+        self.favorites = favorites
+        self.carts = carts
+        self.ingredients_per_recipe = ingredients_per_recipe
+        self.tags_per_recipe = tags_per_recipe
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.log = log or (lambda message: None)
+
+    def generate(self):
+        self.tags = self.create_tags()
+        self.ingredients = self.create_ingredients()
+        self.users = self.create_users()
+        self.recipes = self.create_recipes()
+        self.create_relations(Follow, 'author', self.follows, self.users)
+        self.create_relations(Favorite, 'recipe', self.favorites, self.recipes)
+        self.create_relations(ShoppingList, 'recipe', self.carts, self.recipes)
+        reconcile_counters()
+        invalidate_recipes()
+        return self
+
+    def create_tags(self):
+        for name, color, slug in SYNTHETIC_TAGS:
+            Tag.objects.get_or_create(
+                slug=slug,
+                defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_ingredients(self):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+                for number in range(SYNTHETIC_INGREDIENTS)
+            )
+            invalidate_reference(Ingredient)
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_users(self):
+        password = make_password(None)
+        start = User.objects.count()
+        users = [
+            User(
+                username=f'synthetic_{self.seed}_{number}',
+                email=f'synthetic_{self.seed}_{number}@example.com',
+                first_name='Тест',
+                last_name=f'Пользователь {number}',
+                password=password
+            )
+            for number in range(start, start + self.users_count)
+        ]
+        ids = []
+
+        for batch in batches(users, self.batch_size):
+            ids += [user.id for user in User.objects.bulk_create(batch)]
+
+        self.log(f'Пользователей: {len(ids)}')
+        return ids
+
+    def create_recipes(self):
+        now = timezone.now()
+        period = SYNTHETIC_PERIOD.total_seconds()
+        ids = []
+
+        with explicit_created():
+            for start in range(0, self.recipes_count, self.batch_size):
+                size = min(self.batch_size, self.recipes_count - start)
+                recipes = Recipe.objects.bulk_create(
+                    Recipe(
+                        name=f'Рецепт {start + number}',
+                        text='Синтетический рецепт для нагрузочных тестов.',
+                        image=SYNTHETIC_IMAGE,
+                        image_variants={'source': SYNTHETIC_IMAGE},
+                        cooking_time=self.random.randint(5, 180),
+                        author_id=self.random.choice(self.users),
+                        created=now - timedelta(
+                            seconds=self.random.random() * period
+                        )
+                    )
+                    for number in range(size)
+                )
+                batch_ids = [recipe.id for recipe in recipes]
+                self.create_recipe_links(batch_ids)
+                update_search_vectors(Recipe.objects.filter(id__in=batch_ids))
+                ids += batch_ids
+                self.log(f'Рецептов: {len(ids)}')
+
+        return ids
+
+    def create_recipe_links(self, recipe_ids):
+        tags = []
+        ingredients = []
+
+        for recipe_id in recipe_ids:
+            for tag_id in self.random.sample(
+                self.tags,
+                min(self.random.randint(*self.tags_per_recipe), len(self.tags))
+            ):
+                tags.append(RecipeTag(recipe_id=recipe_id, tag_id=tag_id))
+            for ingredient_id in self.random.sample(
+                self.ingredients,
+                min(
+                    self.random.randint(*self.ingredients_per_recipe),
+                    len(self.ingredients)
+                )
+            ):
+                ingredients.append(IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500)
+                ))
+
+        RecipeTag.objects.bulk_create(tags)
+        IngredientInRecipe.objects.bulk_create(
+            ingredients,
+            batch_size=self.batch_size
+        )
+
+    def create_relations(self, model, target, per_user, targets):
+        """
+        Создает до per_user связей каждого пользователя с targets.
+        """
+
+        if not targets or not per_user:
+            return
+
+        objects = []
+        for user_id in self.users:
+            for target_id in set(self.random.choices(targets, k=per_user)):
+                if target == 'author' and target_id == user_id:
+                    continue
+                objects.append(model(user_id=user_id, **{
+                    f'{target}_id': target_id
+                }))
+
+        model.objects.bulk_create(
+            objects,
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+        self.log(f'{model._meta.verbose_name_plural}: {len(objects)}')
@@ -0,0 +1,271 @@
+"""
+Очередь фоновых задач.
+
+Задача - функция уровня модуля с аргументами, которые сериализуются
+в JSON. Она ставится в очередь вызовом enqueue и выполняется
+бэкендом из настройки TASK_BACKEND:
+
+ThreadBackend - пул потоков в процессе приложения, для разработки
+и тестов. Задачи отправляются после фиксации транзакции и теряются
+при остановке процесса.
+
+DatabaseBackend - таблица Task, которую обрабатывает команда
+run_tasks. Задача записывается в той же транзакции, что и данные,
+и переживает перезапуск. Взятая задача скрыта от других
+обработчиков на TASK_VISIBILITY_TIMEOUT секунд: если обработчик
+упал, не завершив ее, задача выполняется снова.
+
+Упавшая задача повторяется до TASK_MAX_ATTEMPTS раз с задержкой
+TASK_RETRY_DELAY, которая удваивается с каждой попыткой, поэтому
+задачи должны быть идемпотентны.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+DRAIN_BATCH_SIZE = 100
+
+
+def task_name(func):
+    """
+    Путь импорта функции задачи.
+
+    Обработчик находит функцию по этому пути, поэтому лямбды
+    и вложенные функции задачами быть не могут.
+    """
+
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    if '<' in name:
+        raise ValueError(f'Задача должна быть функцией модуля: {name}')
+
+    return name
+
+
+def retry_delay(attempts):
+    """
+    Задержка перед следующей попыткой после attempts неудачных.
+    """
+
+    return settings.TASK_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def close_connections(func, *args):
+    """
+    Выполняет func в фоновом потоке.
+
+    Соединения с базой, открытые потоком, закрываются после задачи.
+    """
+
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+class ThreadBackend:
+    """
+    Задачи выполняются пулом из TASK_WORKERS потоков.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.TASK_WORKERS,
+            thread_name_prefix='tasks'
+        )
+        # Число отправленных, но еще не завершенных задач.
+        self.pending = 0
+        self.idle = threading.Condition()
+
+    def enqueue(self, name, args):
+        # Аргументы проходят через JSON, как в DatabaseBackend,
+        # чтобы несериализуемые аргументы были видны сразу.
+        args = json.loads(json.dumps(args))
+        transaction.on_commit(lambda: self.start(name, args))
+
+    def start(self, name, args):
+        with self.idle:
+            self.pending += 1
+        self.submit(name, args)
+
+    def submit(self, name, args, attempt=1):
+        self.executor.submit(close_connections, self.run, name, args, attempt)
+
+    def run(self, name, args, attempt=1):
+        """
+        Выполняет одну попытку задачи.
+
+        Повтор упавшей задачи отправляется в пул таймером через
+        retry_delay секунд, чтобы ожидание не занимало поток пула.
+        """
+
+        try:
+            import_string(name)(*args)
+        except Exception:
+            logger.exception(
+                'Задача %s%s упала, попытка %s',
+                name,
+                tuple(args),
+                attempt
+            )
+            if attempt < settings.TASK_MAX_ATTEMPTS:
+                timer = threading.Timer(
+                    retry_delay(attempt),
+                    self.submit,
+                    (name, args, attempt + 1)
+                )
+                timer.daemon = True
+                timer.start()
+                return
+
+        with self.idle:
+            self.pending -= 1
+            self.idle.notify_all()
+
+    def drain(self):
+        """
+        Ждет завершения всех отправленных задач, включая повторы.
+        """
+
+        with self.idle:
+            self.idle.wait_for(lambda: not self.pending)
+
+
+class DatabaseBackend:
+    """
+    Задачи хранятся в таблице Task и выполняются командой run_tasks.
+    """
+
+    def enqueue(self, name, args):
+        Task.objects.create(
+            name=name,
+            args=list(args),
+            max_attempts=settings.TASK_MAX_ATTEMPTS
+        )
+
+    def claim(self, limit):
+        """
+        Берет до limit готовых задач и скрывает их от других
+        обработчиков на TASK_VISIBILITY_TIMEOUT секунд.
+
+        Строки блокируются с SKIP LOCKED, поэтому несколько
+        обработчиков не берут одну и ту же задачу.
+        """
+
+        now = timezone.now()
+        locked_until = now + timedelta(
+            seconds=settings.TASK_VISIBILITY_TIMEOUT
+        )
+
+        with transaction.atomic():
+            ids = list(
+                Task.objects.select_for_update(skip_locked=True).filter(
+                    Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+                    status=Task.PENDING,
+                    run_at__lte=now
+                ).order_by('run_at', 'id').values_list('id', flat=True)[
+                    :limit
+                ]
+            )
+            Task.objects.filter(id__in=ids).update(
+                locked_until=locked_until,
+                attempts=F('attempts') + 1
+            )
+
+        return list(Task.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+    def release(self, tasks):
+        """
+        Возвращает в очередь взятые, но не начатые задачи.
+        """
+
+        for task in tasks:
+            Task.objects.filter(
+                id=task.id,
+                locked_until=task.locked_until
+            ).update(locked_until=None, attempts=F('attempts') - 1)
+
+    def run(self, task):
+        """
+        Выполняет взятую задачу.
+
+        Выполненная задача удаляется, упавшая откладывается на время
+        retry_delay, а после max_attempts попыток помечается
+        как FAILED. Если задачу за это время взял другой обработчик
+        (истек таймаут видимости), ее строка не меняется.
+        """
+
+        claimed = Task.objects.filter(
+            id=task.id,
+            locked_until=task.locked_until
+        )
+
+        try:
+            import_string(task.name)(*task.args)
+        except Exception as error:
+            logger.exception(
+                'Задача %s%s упала, попытка %s',
+                task.name,
+                tuple(task.args),
+                task.attempts
+            )
+            if task.attempts >= task.max_attempts:
+                claimed.update(
+                    status=Task.FAILED,
+                    locked_until=None,
+                    last_error=repr(error)
+                )
+            else:
+                claimed.update(
+                    run_at=timezone.now() + timedelta(
+                        seconds=retry_delay(task.attempts)
+                    ),
+                    locked_until=None,
+                    last_error=repr(error)
+                )
+            return False
+
+        claimed.delete()
+        return True
+
+    def drain(self):
+        """
+        Выполняет в текущем процессе все готовые задачи.
+
+        Отложенные после ошибки задачи остаются в очереди.
+        """
+
+        while tasks := self.claim(DRAIN_BATCH_SIZE):
+            for task in tasks:
+                self.run(task)
+
+
+@lru_cache(maxsize=None)
+def get_task_backend():
+    return import_string(settings.TASK_BACKEND)()
+
+
+def enqueue(func, *args):
+    """
+    Ставит вызов func(*args) в очередь фоновых задач.
+
+    Задача выполнится только после фиксации текущей транзакции
+    и не выполнится при ее откате.
+    """
+
+    get_task_backend().enqueue(task_name(func), args)
@@ -8,7 +8,15 @@ class UserAdmin(admin.ModelAdmin):
     Настройки обображения в админке объектов User.
     """
 
-    list_display = ('pk', 'first_name', 'last_name', 'username', 'email')
+    list_display = (
+        'pk',
+        'first_name',
+        'last_name',
+        'username',
+        'email',
+        'recipes_count',
+        'followers_count'
+    )
     list_filter = ('username', 'email')
     search_fields = ('first_name', 'last_name', 'username', 'email')
     empty_value_display = '-пусто-'
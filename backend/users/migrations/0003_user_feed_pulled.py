@@ -0,0 +1,32 @@
+# Generated by Django 4.2.1 on 2026-10-18 05:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled_authors(apps, schema_editor):
+    """
+    Отмечает авторов, чьи рецепты уже читаются при запросе ленты.
+    """
+
+    apps.get_model('users', 'User').objects.filter(
+        followers_count__gte=settings.FEED_PULL_THRESHOLD
+    ).update(feed_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+        # Счетчики подписчиков заполняет миграция recipes.0006.
+        ('recipes', '0009_feed_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_pulled',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Рецепты читаются при запросе ленты'),
+        ),
+        migrations.RunPython(mark_pulled_authors, migrations.RunPython.noop),
+    ]
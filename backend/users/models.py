@@ -31,6 +31,24 @@ class User(AbstractUser):
         max_length=MAX_LENGTH_FIRST_AND_LAST_NAME
     )
 
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False
+    )
+
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
+
+    feed_pulled = models.BooleanField(
+        verbose_name='Рецепты читаются при запросе ленты',
+        default=False,
+        editable=False
+    )
+
     REQUIRED_FIELDS = (
         'username',
         'first_name',
@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -10,11 +12,17 @@ from rest_framework.status import (
 from djoser.views import UserViewSet
 
 from .models import User, Follow
-from api.serializers import CustomUserSerializer, SubscribeSirializer
+from foodgram.instrumentation import SerializerTimingMixin, TimedSerializer
+from recipes.models import Recipe
+from api.serializers import (
+    CustomUserSerializer,
+    SubscribeSirializer,
+    get_recipes_limit
+)
 from api.pagination import CustomListPagination
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(SerializerTimingMixin, UserViewSet):
     """
     Вьюсет для объектов модели User.
     """
@@ -22,15 +30,20 @@ class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = CustomListPagination
+    cursor_ordering = ('id',)
 
     @action(
         methods=['post', 'delete'],
         detail=True,
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def subscribe(self, request, id):
         """
         Добавляет эндпоинт для подписки subscribe.
+
+        Подписка и счетчик подписчиков автора меняются в одной
+        транзакции.
         """
 
         user = request.user
@@ -54,9 +67,9 @@ class CustomUserViewSet(UserViewSet):
                     status=HTTP_400_BAD_REQUEST
                 )
 
-            serializer = SubscribeSirializer(
+            serializer = TimedSerializer(SubscribeSirializer(
                 author, context={"request": request}
-            )
+            ))
 
             return Response(serializer.data, status=HTTP_201_CREATED)
 
@@ -80,12 +93,26 @@ class CustomUserViewSet(UserViewSet):
         """
 
         user = request.user
-        authors = User.objects.filter(following__user=user)
+        recipes = Recipe.objects.all()
+        limit = get_recipes_limit(request)
+
+        if limit is not None:
+            recipes = recipes[:limit]
+
+        authors = User.objects.filter(
+            following__user=user
+        ).order_by('id').prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=recipes,
+                to_attr='prefetched_recipes'
+            )
+        )
         pages = self.paginate_queryset(authors)
 
-        serializer = SubscribeSirializer(
+        serializer = TimedSerializer(SubscribeSirializer(
             pages,
             many=True,
             context={'request': request}
-        )
+        ))
         return self.get_paginated_response(serializer.data)